@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the data layer of the FastAPI service.
+The customer-index benchmark runs on a synthetic book of customers; the startup
+benchmark reads the real files in data/.
+
+Usage:
+    python benchmarks.py customer-index --customers 300000
+    python benchmarks.py startup
+    SHARED_DATA_DIR=/dev/shm/wealth-ai python benchmarks.py shared-memory --workers 4
+    python benchmarks.py prompt-tokens --customers 20
+"""
+
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+import pandas as pd
+from data import (
+    build_customer_index,
+    build_snapshot,
+    data_sources,
+    datasets,
+    load_source,
+    publish_shared_datasets,
+    read_snapshot_manifest,
+    source_datasets,
+)
+
+
+# Build a synthetic book shaped like the customer-keyed tables
+def synthetic_book(n_customers: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    customer_ids = rng.permutation(np.arange(1_000_000, 1_000_000 + n_customers))
+
+    customer_data = pd.DataFrame(
+        {"BP Number WM Core": customer_ids}
+        | {f"Metric {i}": rng.random(n_customers) for i in range(40)}
+    )
+
+    asset_types = ["CASA", "Deposito", "BAC", "RD", "SB"]
+    optimized_portfolio = pd.DataFrame(
+        {
+            "Customer ID": np.repeat(customer_ids, len(asset_types)),
+            "asset_type": np.tile(asset_types, n_customers),
+            "cur_allocation": rng.random(n_customers * len(asset_types)),
+            "recommended_allocation": rng.random(n_customers * len(asset_types)),
+        }
+    )
+
+    n_transactions = n_customers * 8
+    historical_transaction = pd.DataFrame(
+        {
+            "Customer ID": rng.choice(customer_ids, n_transactions),
+            "Product Name": rng.choice(["Fund A", "Fund B", "Fund C"], n_transactions),
+            "Total Amount": rng.random(n_transactions) * 1e5,
+        }
+    )
+    return historical_transaction, customer_data, optimized_portfolio
+
+
+# Compare mask-scan lookups with the customer index
+def bench_customer_index(args):
+    historical_transaction, customer_data, optimized_portfolio = synthetic_book(
+        args.customers
+    )
+    tables = {
+        "customer_data": (customer_data, "BP Number WM Core"),
+        "historical_transaction": (historical_transaction, "Customer ID"),
+        "optimized_portfolio": (optimized_portfolio, "Customer ID"),
+    }
+
+    start = time.perf_counter()
+    customer_index = build_customer_index(
+        historical_transaction, customer_data, optimized_portfolio
+    )
+    build_seconds = time.perf_counter() - start
+    print(f"Customers: {args.customers:,}")
+    print(f"Index build: {build_seconds * 1e3:.1f} ms (once, at load time)")
+
+    rng = np.random.default_rng(1)
+    sample = [
+        int(i) for i in rng.choice(customer_data["BP Number WM Core"], args.lookups)
+    ]
+
+    print(f"{'table':<24}{'mask scan':>14}{'index':>14}{'speedup':>10}")
+    for table, (frame, key) in tables.items():
+        start = time.perf_counter()
+        for customer_id in sample:
+            frame[frame[key] == customer_id]
+        mask_seconds = (time.perf_counter() - start) / len(sample)
+
+        start = time.perf_counter()
+        for customer_id in sample:
+            customer_index.rows(table, customer_id)
+        index_seconds = (time.perf_counter() - start) / len(sample)
+
+        print(
+            f"{table:<24}{mask_seconds * 1e6:>11.1f} us{index_seconds * 1e6:>11.1f} us"
+            f"{mask_seconds / index_seconds:>9.1f}x"
+        )
+
+
+# Compare data load time from the source files with the columnar snapshot
+def bench_startup(args):
+    start = time.perf_counter()
+    for reader in data_sources.values():
+        reader()
+    source_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_snapshot()
+    print(f"Snapshot build: {time.perf_counter() - start:.2f} s")
+
+    manifest = read_snapshot_manifest()
+    start = time.perf_counter()
+    for file_name in data_sources:
+        load_source(file_name, manifest)
+    snapshot_seconds = time.perf_counter() - start
+
+    print(f"Load from source files: {source_seconds:.2f} s")
+    print(f"Load from snapshot:     {snapshot_seconds:.2f} s")
+    print(f"Speedup:                {source_seconds / snapshot_seconds:.1f}x")
+
+
+# Resident memory of this process in KiB, split into shared and private pages
+def memory_kib() -> dict:
+    usage = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss", "Shared_Clean", "Private_Clean", "Private_Dirty"):
+                usage[key] = int(value.split()[0])
+    return usage
+
+
+# Worker body: load every dataset the way an API worker does and report memory
+def load_worker(queue, barrier):
+    before = memory_kib()
+    datasets.warm([name for names in source_datasets.values() for name in names])
+    after = memory_kib()
+    # Hold the mappings until every worker has measured
+    queue.put({key: after[key] - before[key] for key in after})
+    barrier.wait()
+
+
+# Per-worker memory cost of the datasets, with or without the shared-memory copy
+def bench_shared_memory(args):
+    if args.shared_dir:
+        start = time.perf_counter()
+        publish_shared_datasets(args.shared_dir)
+        print(f"Publish: {time.perf_counter() - start:.2f} s")
+
+    context = multiprocessing.get_context("spawn")
+    queue, barrier = context.Queue(), context.Barrier(args.workers)
+    workers = [
+        context.Process(target=load_worker, args=(queue, barrier))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    results = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    print(
+        f"{'worker':<8}{'Rss':>12}{'Pss':>12}{'Private':>12}  (MiB added by datasets)"
+    )
+    for i, usage in enumerate(results):
+        private = usage["Private_Clean"] + usage["Private_Dirty"]
+        print(
+            f"{i:<8}{usage['Rss'] / 1024:>12.1f}{usage['Pss'] / 1024:>12.1f}"
+            f"{private / 1024:>12.1f}"
+        )
+
+
+# Prompt size of every builder with the compact table encoding vs to_dict records
+def bench_prompt_tokens(args):
+    import functions
+    import prompt_format
+
+    customer_ids = list(
+        functions.datasets["customer_data"]["BP Number WM Core"][: args.customers]
+    )
+    transactions = functions.datasets["historical_transaction"]
+    sql_results = transactions.head(args.sql_rows)
+    # __wrapped__: bypass the prompt cache so both encodings are rendered
+    profile = functions.present_customer_profile.__wrapped__
+    optimized = functions.present_optimized_portfolio.__wrapped__
+    history = functions.present_historical_transaction.__wrapped__
+    builders = {
+        "present_customer_profile": lambda c: profile(c, "English"),
+        "previous_period_performance": lambda c: functions.previous_period_performance(
+            c, "English", "how did the client do last year?"
+        ),
+        "present_optimized_portfolio": lambda c: optimized(c, "English"),
+        "present_historical_transaction": lambda c: history(c, "English"),
+        "present_new_portfolio": lambda c: functions.present_new_portfolio(
+            c, "English", 1e6, 0.3, 0.2
+        ),
+        "present_sql_results": lambda c: functions.present_sql_results(
+            sql_results, "English"
+        ),
+        "filter_customers_region": lambda c: functions.filter_customers_region(
+            "top customers", "English"
+        ),
+    }
+
+    print(f"{'builder':<34}{'records':>10}{'table':>10}{'saved':>8}  (≈ tokens)")
+    for name, build in builders.items():
+        tokens = {}
+        for table_format in ("records", "table"):
+            prompt_format.table_format = table_format
+            tokens[table_format] = sum(
+                prompt_format.estimate_tokens(build(c)) for c in customer_ids
+            ) / len(customer_ids)
+        print(
+            f"{name:<34}{tokens['records']:>10,.0f}{tokens['table']:>10,.0f}"
+            f"{1 - tokens['table'] / tokens['records']:>8.0%}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    parser_customer_index = subparsers.add_parser(
+        "customer-index", help="customer lookup latency: mask scan vs index"
+    )
+    parser_customer_index.add_argument("--customers", type=int, default=300_000)
+    parser_customer_index.add_argument("--lookups", type=int, default=200)
+    parser_customer_index.set_defaults(func=bench_customer_index)
+
+    parser_startup = subparsers.add_parser(
+        "startup", help="data load time: source files vs columnar snapshot"
+    )
+    parser_startup.set_defaults(func=bench_startup)
+
+    parser_shared_memory = subparsers.add_parser(
+        "shared-memory", help="per-worker dataset memory, private vs shared"
+    )
+    parser_shared_memory.add_argument("--workers", type=int, default=4)
+    parser_shared_memory.add_argument(
+        "--shared-dir",
+        help="publish to this directory first (set SHARED_DATA_DIR to the same path)",
+    )
+    parser_shared_memory.set_defaults(func=bench_shared_memory)
+
+    parser_prompt_tokens = subparsers.add_parser(
+        "prompt-tokens", help="prompt size per builder: compact tables vs records"
+    )
+    parser_prompt_tokens.add_argument("--customers", type=int, default=20)
+    parser_prompt_tokens.add_argument("--sql-rows", type=int, default=200)
+    parser_prompt_tokens.set_defaults(func=bench_prompt_tokens)
+
+    args = parser.parse_args()
+    args.func(args)
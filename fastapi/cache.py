@@ -0,0 +1,114 @@
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+# Normalize free text for use as a cache key: lowercase, no punctuation, single spaces
+def normalize_text(text: str) -> str:
+    return " ".join(re.sub(r"[^\w%]+", " ", text.lower()).split())
+
+
+# Canonical form of a SQL statement for use as a cache key: outside quoted literals
+# and identifiers, lowercase, no insignificant whitespace and no trailing semicolon
+def canonicalize_sql(query: str) -> str:
+    parts = re.split(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""", query.strip().rstrip(";"))
+    return "".join(
+        part if i % 2 else _compact_sql(part) for i, part in enumerate(parts)
+    )
+
+
+def _compact_sql(text: str) -> str:
+    text = " ".join(text.lower().split())
+    return re.sub(r" ?([(),=<>!+*/-]) ?", r"\1", text).strip()
+
+
+# Stable short hash of any JSON-serializable object (e.g. tool definitions)
+def fingerprint(obj) -> str:
+    payload = json.dumps(obj, sort_keys=True, default=str).encode()
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+# Bounded in-process cache
+class LRUCache:
+    """
+    Least-recently-used cache with an optional time-to-live, an optional memory
+    bound and hit/miss counters. Entries past their TTL are treated as misses and
+    dropped on access; values larger than maxbytes are not cached.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        maxbytes: Optional[int] = None,
+        sizeof=None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Optional memory bound: sizeof(value) is charged against maxbytes
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof or sys.getsizeof
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._pop(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        size = self.sizeof(value) if self.maxbytes else 0
+        if self.maxbytes and size > self.maxbytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (expires_at, value, size)
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (
+                self.maxbytes and self.nbytes > self.maxbytes
+            ):
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        self.nbytes -= self._data.pop(key)[2]
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "nbytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
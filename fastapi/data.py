@@ -1,19 +1,366 @@
+import functools
+import hashlib
+import json
+import logging
 import os
+import re
+import shutil
+import sys
+import threading
+import time
+from typing import Optional
 
+import numpy as np
 import pandas as pd
-import psycopg2
-from setup import DATABASE_URL
-from sqlalchemy import create_engine
+import pyarrow as pa
+from pyarrow import feather
+from db import fetch_dataframe
+from ingest import (
+    INGEST_CHUNK_ROWS,
+    copy_chunks_to_postgres,
+    read_ingestion_manifest,
+    update_ingestion_manifest,
+)
+from setup import SHARED_DATA_DIR
 
-# Add PostgreSQL engine creation with echo=False to hide SQL output
-engine = create_engine(DATABASE_URL, echo=False)
+logger = logging.getLogger(__name__)
 
 
-# Load data
-def load_data():
+# Version of the data served by this process: a counter advanced whenever this
+# process reloads data (load_data, the product catalog), plus the latest
+# ingestion into PostgreSQL. Ingestion runs in init-db.py, a separate process,
+# so its part is read from the shared ingestion_manifest table by
+# refresh_ingestion_version. Caches keyed on the version never serve results
+# from before a reload or an ingestion.
+_data_version = 0
+_ingested_at = None
 
-    # Load Mutual Fund data from Excel file
-    file_path = os.path.join(os.path.dirname(__file__), "data", "Mutual_Fund_Data.xlsx")
+
+def current_data_version() -> tuple:
+    return (_data_version, _ingested_at)
+
+
+def bump_data_version() -> int:
+    global _data_version
+    _data_version += 1
+    return _data_version
+
+
+async def refresh_ingestion_version() -> bool:
+    """
+    Re-read the time of the latest PostgreSQL ingestion, so an ingestion by
+    init-db.py advances the data version of every worker. Errors (e.g. no
+    database yet) keep the current version.
+
+    Returns:
+    bool: True if an ingestion happened since the previous read
+    """
+    global _ingested_at
+    try:
+        frame = await fetch_dataframe(
+            "SELECT max(loaded_at) AS loaded_at FROM ingestion_manifest"
+        )
+    except Exception as e:
+        logger.debug(f"Ingestion version not read: {e}")
+        return False
+    ingested_at = frame["loaded_at"].iat[0] if not frame.empty else None
+    ingested_at = None if pd.isna(ingested_at) else str(ingested_at)
+    changed = ingested_at != _ingested_at
+    if changed:
+        logger.info(f"Data ingested at {ingested_at}; cached results invalidated")
+    _ingested_at = ingested_at
+    return changed
+
+
+# Customer ID column of each customer-keyed table
+customer_keys = {
+    "customer_data": "BP Number WM Core",
+    "historical_transaction": "Customer ID",
+    "optimized_portfolio": "Customer ID",
+    "transaction_summary": "Customer ID",
+    "transaction_top_rows": "Customer ID",
+}
+
+
+# Per-customer row index over the customer-keyed tables
+class CustomerIndex:
+    """
+    Position map from customer ID to row positions for each customer-keyed table.
+    Each table's map is built once, on its first lookup, so that fetching a
+    customer's rows is a dictionary lookup plus a positional slice instead of a
+    boolean-mask scan of the frame.
+    """
+
+    _empty = np.array([], dtype=np.intp)
+
+    def __init__(self, frames, keys: dict = customer_keys):
+        # frames: mapping of table name to DataFrame (a dict or the dataset registry)
+        self._frames = frames
+        self._keys = keys
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def positions(self, table: str) -> dict:
+        if table not in self._positions:
+            with self._lock:
+                if table not in self._positions:
+                    frame = self._frames[table]
+                    self._positions[table] = frame.groupby(
+                        self._keys[table], sort=False
+                    ).indices
+        return self._positions[table]
+
+    def rows(self, table: str, customer_id) -> pd.DataFrame:
+        positions = self.positions(table).get(customer_id, self._empty)
+        return self._frames[table].iloc[positions]
+
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+
+
+# Build the customer index for the customer-keyed tables
+def build_customer_index(historical_transaction, customer_data, optimized_portfolio):
+    frames = {
+        "customer_data": customer_data,
+        "historical_transaction": historical_transaction,
+        "optimized_portfolio": optimized_portfolio,
+    }
+    customer_index = CustomerIndex(frames)
+    for table in frames:
+        customer_index.positions(table)
+    return customer_index
+
+
+# Grouping of the per-customer transaction summary
+transaction_summary_keys = ["Customer ID", "Year", "Quarter", "Asset Type"]
+
+
+def summarize_transactions(
+    historical_transaction: pd.DataFrame, top_products: int = 3, top_rows: int = 10
+) -> dict:
+    """
+    Aggregate historical_transaction once so prompt builders cost the same for
+    every customer, however long their history.
+
+    Returns:
+    dict:
+    - transaction_summary: one row per customer, quarter and asset type with the
+      number of transactions, total amount, current amount, profit and the
+      top_products most bought products, e.g. "Fund A (3), Fund B (1)"
+    - transaction_top_rows: the top_rows largest transactions of each customer
+    """
+    keys = transaction_summary_keys
+    summary = historical_transaction.groupby(keys, sort=False).agg(
+        **{
+            "Number of Transaction": ("Number of Transaction", "sum"),
+            "Total Amount": ("Total Amount", "sum"),
+            "Current Amount": ("Current Amount", "sum"),
+            "Profit": ("Profit", "sum"),
+        }
+    )
+
+    products = (
+        historical_transaction.groupby(keys + ["Product Name"], sort=False)[
+            "Number of Transaction"
+        ]
+        .sum()
+        .reset_index()
+        .sort_values(keys + ["Number of Transaction"], ascending=[True] * 4 + [False])
+    )
+    products["rank"] = products.groupby(keys, sort=False).cumcount()
+    products = products[products["rank"] < top_products]
+    labels = (
+        products["Product Name"]
+        + " ("
+        + products["Number of Transaction"].astype(str)
+        + ")"
+    )
+    # One column per rank, joined column-wise: no Python call per group
+    ranked = labels.set_axis(
+        pd.MultiIndex.from_frame(products[keys + ["rank"]])
+    ).unstack("rank")
+    top_labels = ranked[0]
+    for rank in ranked.columns[1:]:
+        top_labels = top_labels.where(
+            ranked[rank].isna(), top_labels + ", " + ranked[rank]
+        )
+    summary["Top Products"] = top_labels
+    summary = summary.reset_index().sort_values(keys, ignore_index=True)
+
+    top = (
+        historical_transaction.sort_values("Total Amount", ascending=False)
+        .groupby("Customer ID", sort=False)
+        .head(top_rows)
+        .reset_index(drop=True)
+    )
+    return {"transaction_summary": summary, "transaction_top_rows": top}
+
+
+# Region and area columns of customer_data, in filter order
+region_columns = ["Region Number", "Region Name", "Nama Area"]
+
+
+# Region/area index over customer_data with per-group AUM rankings
+class RegionIndex:
+    """
+    Finds the regions and areas named in a question with one compiled
+    alternation over all names (longest first, whole words, case-insensitive),
+    and keeps the customers of every region and area ranked by AUM, so the top
+    N of a group is a slice. Rankings are built per AUM column (i.e. per
+    quarter) on first use.
+    """
+
+    def __init__(self, customer_data: pd.DataFrame, columns: list = region_columns):
+        self._frame = customer_data
+        self._columns = columns
+        self._names = {}
+        for column in columns:
+            for value in customer_data[column].dropna().unique():
+                self._names.setdefault(str(value).lower(), []).append((column, value))
+        alternation = "|".join(
+            re.escape(name) for name in sorted(self._names, key=len, reverse=True)
+        )
+        self._matcher = re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE)
+        self._rankings = {}
+        self._lock = threading.Lock()
+
+    # Region/area filters named in the question, as {column: value}
+    def match(self, question: str) -> dict:
+        filters = {}
+        for found in self._matcher.finditer(question):
+            for column, value in self._names[found.group(0).lower()]:
+                filters.setdefault(column, value)
+        return filters
+
+    # Row positions ranked by AUM, overall (key None) and per (column, value)
+    def ranking(self, aum_column: str) -> dict:
+        if aum_column not in self._rankings:
+            with self._lock:
+                if aum_column not in self._rankings:
+                    aum = self._frame[aum_column].to_numpy()
+                    # NaN AUM ranks last
+                    order = np.argsort(-np.nan_to_num(aum, nan=-np.inf), kind="stable")
+                    ranked = self._frame.iloc[order]
+                    ranking = {None: order}
+                    for column in self._columns:
+                        for value, positions in ranked.groupby(
+                            column, sort=False
+                        ).indices.items():
+                            ranking[(column, value)] = order[positions]
+                    self._rankings[aum_column] = ranking
+        return self._rankings[aum_column]
+
+    def top(
+        self, filters: dict, aum_column: str, n: int, columns: Optional[list] = None
+    ) -> pd.DataFrame:
+        """
+        Top n customers by aum_column among those matching every filter, with
+        the given columns (default: all). One filter is a slice of its ranking;
+        several intersect the smallest ranking with the others, keeping its order.
+        """
+        ranking = self.ranking(aum_column)
+        groups = [ranking.get(item, CustomerIndex._empty) for item in filters.items()]
+        if groups:
+            groups.sort(key=len)
+            positions = groups[0]
+            for other in groups[1:]:
+                positions = positions[np.isin(positions, other)]
+        else:
+            positions = ranking[None]
+        if columns is None:
+            return self._frame.iloc[positions[:n]]
+        return self._frame.iloc[positions[:n], self._frame.columns.get_indexer(columns)]
+
+
+# Metrics reported per quarter in customer_data, in prompt order (FUM first, then FBI)
+period_metrics = [
+    "CASA",
+    "Deposito",
+    "AUM RD",
+    "AUM SBN PERDANA",
+    "AUM SBN SEKUNDER",
+    "AUM BAC",
+    "FBI RD",
+    "FBI SBN PERDANA",
+    "FBI SBN SEKUNDER",
+    "FBI BAC",
+]
+
+
+# Catalog of the quarterly columns in customer_data
+class PeriodCatalog:
+    """
+    Every quarter available in customer_data and the column position of each
+    (metric, quarter) pair. Built once at load time; "latest", "N quarters back"
+    and "YoY pair" are answered from precomputed lists without scanning columns.
+    Periods are strings like "Q4 2023".
+    """
+
+    _pattern = re.compile(r"^(?P<metric>.+) (?P<quarter>Q[1-4]) (?P<year>20[0-9]{2})$")
+
+    def __init__(self, columns, metrics=period_metrics):
+        self._columns = list(columns)
+        self._positions = {}
+        self._period_positions = {}
+        for position, column in enumerate(self._columns):
+            match = self._pattern.match(column)
+            if match is None:
+                continue
+            period = f"{match['quarter']} {match['year']}"
+            self._positions[(match["metric"], period)] = position
+            self._period_positions.setdefault(period, []).append(position)
+
+        # Only quarters that report every metric count as available periods
+        self.quarters = sorted(
+            (
+                period
+                for period in self._period_positions
+                if all((metric, period) in self._positions for metric in metrics)
+            ),
+            key=lambda period: (period[3:], period[:2]),
+        )
+        self._offsets = {period: i for i, period in enumerate(self.quarters)}
+
+    @property
+    def latest(self) -> str:
+        return self.quarters[-1]
+
+    # Period n quarters before `period` (default: latest), clamped to the oldest available
+    def back(self, n: int, period: Optional[str] = None) -> str:
+        offset = self._offsets[period or self.latest] - n
+        return self.quarters[max(offset, 0)]
+
+    # (period, same quarter one year earlier); the earlier one is None if not available
+    def yoy(self, period: Optional[str] = None) -> tuple:
+        period = period or self.latest
+        previous = f"{period[:2]} {int(period[3:]) - 1}"
+        return period, previous if previous in self._offsets else None
+
+    def position(self, metric: str, period: str) -> int:
+        return self._positions[(metric, period)]
+
+    def columns(self, metrics: list, period: str) -> list:
+        return [self._columns[self._positions[(metric, period)]] for metric in metrics]
+
+    # All columns of a period whose name starts with `prefix` (e.g. "%" for allocation shares)
+    def period_columns(self, period: str, prefix: str = "") -> list:
+        return [
+            self._columns[position]
+            for position in self._period_positions[period]
+            if self._columns[position].startswith(prefix)
+        ]
+
+
+# Data files and the columnar snapshot built from them
+data_dir = os.path.join(os.path.dirname(__file__), "data")
+snapshot_dir = os.path.join(data_dir, "snapshot")
+snapshot_format = 2
+
+
+# Load Mutual Fund data from Excel file
+def read_mutual_fund_data():
+    file_path = os.path.join(data_dir, "Mutual_Fund_Data.xlsx")
     sheets = [
         "Mutual Fund Equity",
         "Mutual Fund Fixed Income",
@@ -22,15 +369,17 @@ def load_data():
     mutual_fund_data = pd.read_excel(file_path, sheet_name=sheets)
 
     # Extract data for each sheet
-    Mutual_Fund_Equity = mutual_fund_data["Mutual Fund Equity"]
-    Mutual_Fund_Fixed_Income = mutual_fund_data["Mutual Fund Fixed Income"]
-    Mutual_Fund_Money_Market = mutual_fund_data["Mutual Funds Money Market"]
+    return {
+        "Mutual_Fund_Equity": mutual_fund_data["Mutual Fund Equity"],
+        "Mutual_Fund_Fixed_Income": mutual_fund_data["Mutual Fund Fixed Income"],
+        "Mutual_Fund_Money_Market": mutual_fund_data["Mutual Funds Money Market"],
+    }
+
 
-    # Load historical transaction data
+# Load historical transaction data
+def read_historical_transaction():
     historical_transaction = pd.read_csv(
-        os.path.join(
-            os.path.dirname(__file__), "data", "historical_transaction_usd.csv"
-        )
+        os.path.join(data_dir, "historical_transaction_usd.csv")
     )
     historical_transaction = historical_transaction[
         historical_transaction["Year"] < 2024
@@ -62,12 +411,13 @@ def load_data():
     historical_transaction = historical_transaction.sort_values(
         by=["Year", "Quarter"], ascending=[False, False]
     )
+    return {"historical_transaction": historical_transaction}
 
-    # load customer data
+
+# load customer data
+def read_customer_data():
     customer_data = pd.read_csv(
-        os.path.join(
-            os.path.dirname(__file__), "data", "Master_Data_for_RM_Tableau_usd.csv"
-        )
+        os.path.join(data_dir, "Master_Data_for_RM_Tableau_usd.csv")
     )
     customer_data = customer_data.rename(columns={"Client Segment ": "Client Segment"})
     customer_data[["Region Number", "Region Name"]] = customer_data["Region"].str.split(
@@ -75,10 +425,13 @@ def load_data():
     )
     customer_data["Region Number"] = customer_data["Region Number"].str.strip()
     customer_data["Region Name"] = customer_data["Region Name"].str.strip()
+    return {"customer_data": customer_data}
 
-    # Load optimized portfolio data
+
+# Load optimized portfolio data
+def read_optimized_portfolio():
     optimized_portfolio = pd.read_csv(
-        os.path.join(os.path.dirname(__file__), "data", "optimized_allocation_usd.csv")
+        os.path.join(data_dir, "optimized_allocation_usd.csv")
     )
     optimized_portfolio["BP Number WM Core"] = optimized_portfolio[
         "BP Number WM Core"
@@ -89,64 +442,410 @@ def load_data():
         },
         inplace=True,
     )
+    return {"optimized_portfolio": optimized_portfolio}
+
+
+# Source file and reader of every dataset group
+data_sources = {
+    "Mutual_Fund_Data.xlsx": read_mutual_fund_data,
+    "historical_transaction_usd.csv": read_historical_transaction,
+    "Master_Data_for_RM_Tableau_usd.csv": read_customer_data,
+    "optimized_allocation_usd.csv": read_optimized_portfolio,
+}
+
+# Datasets produced by each source file
+source_datasets = {
+    "Mutual_Fund_Data.xlsx": [
+        "Mutual_Fund_Equity",
+        "Mutual_Fund_Fixed_Income",
+        "Mutual_Fund_Money_Market",
+    ],
+    "historical_transaction_usd.csv": ["historical_transaction"],
+    "Master_Data_for_RM_Tableau_usd.csv": ["customer_data"],
+    "optimized_allocation_usd.csv": ["optimized_portfolio"],
+}
+
+
+# Size, mtime and content hash of a source file; the hash is reused while size and mtime match
+def source_fingerprint(file_name: str, previous: Optional[dict] = None) -> dict:
+    stat = os.stat(os.path.join(data_dir, file_name))
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if previous and all(previous.get(k) == v for k, v in fingerprint.items()):
+        fingerprint["sha256"] = previous["sha256"]
+        return fingerprint
+
+    digest = hashlib.sha256()
+    with open(os.path.join(data_dir, file_name), "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
+
+
+def read_snapshot_manifest(directory: str = snapshot_dir) -> Optional[dict]:
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("format") == snapshot_format else None
+
 
-    return (
-        Mutual_Fund_Equity,
-        Mutual_Fund_Fixed_Income,
-        Mutual_Fund_Money_Market,
-        historical_transaction,
-        customer_data,
-        optimized_portfolio,
+# Whether the snapshot described by manifest is up to date with a source file
+def snapshot_is_fresh(file_name: str, manifest: Optional[dict]) -> bool:
+    recorded = (manifest or {}).get("sources", {}).get(file_name)
+    return bool(recorded) and source_fingerprint(file_name, recorded) == recorded
+
+
+# Write the post-processed frames to an uncompressed Arrow IPC (Feather v2) snapshot
+def build_snapshot() -> dict:
+    """
+    Read every source file, post-process it as load_data does and write one
+    memory-mappable Arrow file per dataset, plus a manifest with the content
+    hash of each source file. Files are written to temporary names and renamed,
+    and the manifest is written last, so readers never see a partial snapshot.
+    Each file holds a single record batch, so every numeric column is one
+    contiguous buffer that readers can use in place.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    previous = (read_snapshot_manifest() or {}).get("sources", {})
+    manifest = {"format": snapshot_format, "sources": {}, "datasets": {}}
+    for file_name, reader in data_sources.items():
+        manifest["sources"][file_name] = source_fingerprint(
+            file_name, previous.get(file_name)
+        )
+        for name, frame in reader().items():
+            path = os.path.join(snapshot_dir, f"{name}.arrow")
+            feather.write_feather(
+                _arrow_compatible(frame),
+                f"{path}.tmp",
+                compression="uncompressed",
+                chunksize=max(len(frame), 1),
+            )
+            os.replace(f"{path}.tmp", path)
+            manifest["datasets"][name] = file_name
+
+    _write_manifest(manifest, snapshot_dir)
+    return manifest
+
+
+# Build the snapshot only if a source file changed since it was written
+def ensure_snapshot(force: bool = False) -> tuple:
+    """
+    Reuse the existing snapshot when every source file still matches its
+    manifest fingerprint and every dataset file is present; otherwise (or with
+    force) rebuild it.
+
+    Returns:
+    tuple: (manifest, whether the snapshot was rebuilt)
+    """
+    manifest = read_snapshot_manifest()
+    if (
+        not force
+        and manifest is not None
+        and all(snapshot_is_fresh(file_name, manifest) for file_name in data_sources)
+        and all(
+            os.path.exists(os.path.join(snapshot_dir, f"{name}.arrow"))
+            for name in manifest["datasets"]
+        )
+    ):
+        return manifest, False
+    return build_snapshot(), True
+
+
+def _write_manifest(manifest: dict, directory: str):
+    path = os.path.join(directory, "manifest.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+# Publish the snapshot to a shared-memory directory for every worker on the host
+def publish_shared_datasets(target_dir: Optional[str] = None) -> dict:
+    """
+    Run once by the loader process (init-db.py) before the workers start.
+    Rebuilds the snapshot if a source file changed, then copies it to
+    target_dir (SHARED_DATA_DIR, normally a tmpfs such as /dev/shm/wealth-ai).
+    Workers memory-map the published files, so the numeric columns of every
+    dataset are the same read-only physical pages in all of them.
+    Files are replaced by rename: workers still mapping an older file keep a
+    valid mapping until they reload.
+    """
+    target_dir = target_dir or SHARED_DATA_DIR
+    if not target_dir:
+        raise ValueError("SHARED_DATA_DIR is not set")
+
+    manifest, _ = ensure_snapshot()
+
+    os.makedirs(target_dir, exist_ok=True)
+    for name in manifest["datasets"]:
+        path = os.path.join(target_dir, f"{name}.arrow")
+        shutil.copyfile(os.path.join(snapshot_dir, f"{name}.arrow"), f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+    _write_manifest(manifest, target_dir)
+    return manifest
+
+
+# Excel sheets can hold mixed-type object columns that Arrow can't store; keep them as text
+def _arrow_compatible(frame: pd.DataFrame) -> pd.DataFrame:
+    frame = frame.copy()
+    frame.columns = [str(column) for column in frame.columns]
+    for column in frame.columns[frame.dtypes == object]:
+        try:
+            pa.array(frame[column], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            frame[column] = frame[column].where(
+                frame[column].isna(), frame[column].astype(str)
+            )
+    return frame
+
+
+# Memory-map an Arrow file. With zero_copy, numeric columns without nulls stay
+# read-only views of the mapped pages (text columns are still materialized per
+# process); one block per column makes wide row selections a few times slower.
+def read_arrow_frame(path: str, zero_copy: bool = False) -> pd.DataFrame:
+    table = feather.read_table(path, memory_map=True)
+    return table.to_pandas(split_blocks=zero_copy)
+
+
+# Datasets of a source file, memory-mapped from the snapshot if it is fresh
+def load_source(
+    file_name: str, manifest: Optional[dict], directory: str = snapshot_dir
+) -> dict:
+    start = time.perf_counter()
+    if snapshot_is_fresh(file_name, manifest):
+        # Attach zero-copy to a shared-memory publication, copy from the local snapshot
+        shared = directory != snapshot_dir
+        frames = {
+            name: read_arrow_frame(os.path.join(directory, f"{name}.arrow"), shared)
+            for name, source in manifest["datasets"].items()
+            if source == file_name
+        }
+        origin = "shared memory" if shared else "snapshot"
+    else:
+        frames = data_sources[file_name]()
+        origin = "source file"
+    logger.info(
+        f"Loaded {file_name} from {origin} in {time.perf_counter() - start:.2f} s"
     )
+    return frames
+
+
+# Registry of lazily loaded, process-resident datasets
+class DatasetRegistry:
+    """
+    Datasets load on first access and then stay resident. A loader may return
+    several datasets at once (e.g. all sheets of one Excel file); all of them are
+    kept. Load time is recorded per loader call and memory per dataset, so unused
+    tables cost nothing at startup and the cost of used ones is visible.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._values = {}
+        self._stats = {}
+        self._nested_seconds = []
+        self._lock = threading.RLock()
+
+    # Register a loader returning {name: dataset} for the given names
+    def register(self, names: list, loader):
+        for name in names:
+            self._loaders[name] = loader
+
+    def __getitem__(self, name: str):
+        if name not in self._values:
+            with self._lock:
+                if name not in self._values:
+                    self._load(name)
+        return self._values[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._loaders
+
+    def _load(self, name: str):
+        # Time spent loading dependencies (nested loads) is attributed to them only
+        self._nested_seconds.append(0.0)
+        start = time.perf_counter()
+        try:
+            loaded = self._loaders[name]()
+        finally:
+            nested_seconds = self._nested_seconds.pop()
+        total_seconds = time.perf_counter() - start
+        if self._nested_seconds:
+            self._nested_seconds[-1] += total_seconds
+        seconds = total_seconds - nested_seconds
+        for loaded_name, value in loaded.items():
+            self._values[loaded_name] = value
+            self._stats[loaded_name] = {"load_seconds": seconds, "bytes": None}
+        logger.info(f"Dataset {', '.join(loaded)} loaded in {seconds:.2f} s")
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._values
+
+    def loaded(self) -> list:
+        return [name for name in self._loaders if name in self._values]
+
+    # Load the given datasets now instead of on first access
+    def warm(self, names: list):
+        for name in names:
+            self[name]
+
+    # Drop the given (default: all) loaded datasets so they load again on next access
+    def unload(self, names: Optional[list] = None):
+        with self._lock:
+            for name in list(self._values if names is None else names):
+                self._values.pop(name, None)
+                self._stats.pop(name, None)
+
+    # Load time and memory of every loaded dataset; DataFrame memory is measured once
+    def stats(self) -> dict:
+        with self._lock:
+            for name, stats in self._stats.items():
+                if stats["bytes"] is None:
+                    value = self._values[name]
+                    stats["bytes"] = (
+                        int(value.memory_usage(deep=True).sum())
+                        if isinstance(value, pd.DataFrame)
+                        else sys.getsizeof(value)
+                    )
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+# Load the datasets of one source file: attach to the published shared-memory
+# copy when SHARED_DATA_DIR is set, else from the snapshot when it is fresh
+def load_source_datasets(file_name: str) -> dict:
+    if SHARED_DATA_DIR:
+        manifest = read_snapshot_manifest(SHARED_DATA_DIR)
+        if manifest is not None:
+            return load_source(file_name, manifest, SHARED_DATA_DIR)
+        logger.warning(f"No datasets published in {SHARED_DATA_DIR}, using snapshot")
+    return load_source(file_name, read_snapshot_manifest())
+
+
+# Process-wide datasets, loaded on first access
+datasets = DatasetRegistry()
+for _file_name, _names in source_datasets.items():
+    datasets.register(_names, functools.partial(load_source_datasets, _file_name))
+datasets.register(
+    ["period_catalog"],
+    lambda: {"period_catalog": PeriodCatalog(datasets["customer_data"].columns)},
+)
+datasets.register(
+    ["region_index"],
+    lambda: {"region_index": RegionIndex(datasets["customer_data"])},
+)
+datasets.register(
+    ["transaction_summary", "transaction_top_rows"],
+    lambda: summarize_transactions(datasets["historical_transaction"]),
+)
+
+# Per-customer row index over the registry; each table is indexed on first lookup
+customer_index = CustomerIndex(datasets)
+
+
+# (Re)load datasets eagerly, e.g. after the data files changed
+def load_data(names: Optional[list] = None):
+    """
+    Drop the given (default: all loaded) datasets and the customer index and load
+    them again now. Advances the data version so cached prompts are invalidated.
+    """
+    names = names or datasets.loaded()
+    datasets.unload(names)
+    customer_index.clear()
+    datasets.warm(names)
+    bump_data_version()
+
+
+# Column names and types of the customer_transaction table
+customer_transaction_types = {
+    "Customer ID": "BIGINT",
+    "Product Name": "TEXT",
+    "Product Type": "TEXT",
+    "Product Detail": "TEXT",
+    "Number of Transaction": "BIGINT",
+    "Total Amount": "DOUBLE PRECISION",
+    "Quarter": "TEXT",
+    "Year": "BIGINT",
+    "Asset Type": "TEXT",
+    "Transaction ID": "TEXT",
+    "Price Bought": "BIGINT",
+    "Current Price": "BIGINT",
+    "Return": "DOUBLE PRECISION",
+    "Profit": "DOUBLE PRECISION",
+    "Current Amount": "DOUBLE PRECISION",
+}
 
 
 # Function to convert Excel file to PostgreSQL database
-def input_product_data_to_postgres():
-    # Read Excel file
-    df = pd.read_excel(
-        os.path.join(os.path.dirname(__file__), "data", "product_data.xlsx")
-    )
-    # Convert to PostgreSQL database
-    df.to_sql("product_data", con=engine, if_exists="replace", index=False)
+def input_product_data_to_postgres(source: Optional[dict] = None) -> dict:
+    # Excel can't be read in chunks; the catalog is small, so it goes in one COPY
+    df = pd.read_excel(os.path.join(data_dir, "product_data.xlsx"))
+    stats = copy_chunks_to_postgres("product_data", [df], source=source)
+    return stats
 
 
 # Function to convert customer historical transaction CSV file to PostgreSQL database
-def input_customer_transaction_to_postgres():
-    df = pd.read_csv(
-        os.path.join(
-            os.path.dirname(__file__), "data", "historical_transaction_usd.csv"
-        )
+def input_customer_transaction_to_postgres(source: Optional[dict] = None) -> dict:
+    chunks = pd.read_csv(
+        os.path.join(data_dir, "historical_transaction_usd.csv"),
+        header=0,
+        names=list(customer_transaction_types),
+        dtype={"Transaction ID": str},
+        chunksize=INGEST_CHUNK_ROWS,
     )
-    df.columns = [
-        "Customer ID",
-        "Product Name",
-        "Product Type",
-        "Product Detail",
-        "Number of Transaction",
-        "Total Amount",
-        "Quarter",
-        "Year",
-        "Asset Type",
-        "Transaction ID",
-        "Price Bought",
-        "Current Price",
-        "Return",
-        "Profit",
-        "Current Amount",
-    ]
-    df.to_sql("customer_transaction", con=engine, if_exists="replace", index=False)
+    stats = copy_chunks_to_postgres(
+        "customer_transaction", chunks, customer_transaction_types, source
+    )
+    return stats
+
+
+# Source file and loader of every table ingested into PostgreSQL
+ingestion_sources = {
+    "product_data": ("product_data.xlsx", input_product_data_to_postgres),
+    "customer_transaction": (
+        "historical_transaction_usd.csv",
+        input_customer_transaction_to_postgres,
+    ),
+}
+
+
+def ingest_changed_sources(force: bool = False) -> list:
+    """
+    Load every table whose source file changed since it was last loaded, as
+    recorded in the ingestion_manifest table. Files are compared by content
+    hash, which is only recomputed when size or mtime moved. Only init-db.py
+    runs this; importing data has no database side effects.
+
+    Parameters:
+    force (bool): Reload every table even if its source file is unchanged
+
+    Returns:
+    list: Load stats per table; skipped tables have "skipped": True
+    """
+    manifest = read_ingestion_manifest()
+    results = []
+    for table, (file_name, load) in ingestion_sources.items():
+        recorded = manifest.get(table)
+        source = source_fingerprint(file_name, recorded)
+        if force or not recorded or recorded["sha256"] != source["sha256"]:
+            results.append(load(source))
+            continue
+        if recorded != source:
+            update_ingestion_manifest(table, source)
+        logger.info(f"Skipped {table}: {file_name} is unchanged")
+        results.append({"table": table, "skipped": True})
+    return results
 
 
 # Function to get table schemas
-def get_table_schemas(table_name: str):
-    conn = psycopg2.connect(DATABASE_URL)
-    schema_query = f"""
+async def get_table_schemas(table_name: str):
+    schema_query = """
         SELECT column_name, data_type, is_nullable, column_default
         FROM information_schema.columns 
-        WHERE table_name = '{table_name}'
+        WHERE table_name = %s
         ORDER BY ordinal_position
     """
-    schemas = pd.read_sql_query(schema_query, conn)
+    schemas = await fetch_dataframe(schema_query, (table_name,))
     table_schemas = f"Table {table_name}:\n"
     for _, row in schemas.iterrows():
         nullable = "NULL" if row["is_nullable"] == "YES" else "NOT NULL"
@@ -154,21 +853,13 @@ def get_table_schemas(table_name: str):
         table_schemas += (
             f"    {row['column_name']} {row['data_type']} {nullable}{default}\n"
         )
-    conn.close()
 
     return table_schemas
 
 
-# Run this function to convert product data Excel file to PostgreSQL database
-input_product_data_to_postgres()
-
-# Run this function to convert customer historical transaction data CSV file to PostgreSQL database
-input_customer_transaction_to_postgres()
-
-
 # # Get table schemas
-# table_schemas_product_data = get_table_schemas("product_data")
-# table_schemas_customer_transaction = get_table_schemas("customer_transaction")
+# table_schemas_product_data = await get_table_schemas("product_data")
+# table_schemas_customer_transaction = await get_table_schemas("customer_transaction")
 
 table_schemas_product_data = """
     Table Name: product_data
@@ -0,0 +1,126 @@
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import pandas as pd
+from metrics import observe_db_query
+from psycopg_pool import AsyncConnectionPool
+from setup import DATABASE_URL
+
+# Connection pool configuration
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+# Bounds for LLM-generated SQL
+SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "5000"))
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "200"))
+SQL_MAX_BYTES = int(os.getenv("SQL_MAX_BYTES", str(64 * 1024)))
+SQL_FETCH_SIZE = int(os.getenv("SQL_FETCH_SIZE", "50"))
+
+# Process-wide PostgreSQL connection pool.
+# Opened on app startup; connections are health-checked on checkout and recycled
+# after DB_POOL_MAX_IDLE seconds idle, so every request reuses an authenticated
+# connection instead of paying for connect/auth and holding max_connections slots.
+db_pool = AsyncConnectionPool(
+    DATABASE_URL,
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    max_idle=DB_POOL_MAX_IDLE,
+    check=AsyncConnectionPool.check_connection,
+    name="wealth-ai",
+    open=False,
+)
+
+
+# Open the pool (idempotent)
+async def open_db_pool():
+    await db_pool.open()
+
+
+# Close the pool and all its connections
+async def close_db_pool():
+    await db_pool.close()
+
+
+# Check out a pooled connection with a statement timeout for this checkout only
+@asynccontextmanager
+async def db_connection(
+    statement_timeout_ms: Optional[int] = None, read_only: bool = False
+):
+    timeout = statement_timeout_ms or DB_STATEMENT_TIMEOUT_MS
+    async with db_pool.connection() as conn:
+        # is_local=true: the setting ends with the transaction, i.e. with the checkout
+        await conn.execute(
+            "SELECT set_config('statement_timeout', %s, true)", (str(timeout),)
+        )
+        if read_only:
+            # Any write in this checkout fails with ReadOnlySqlTransaction
+            await conn.execute("SET TRANSACTION READ ONLY")
+        yield conn
+
+
+# Run a query on a pooled connection and return the result as a DataFrame
+async def fetch_dataframe(
+    query: str, params=None, statement_timeout_ms: Optional[int] = None
+) -> pd.DataFrame:
+    start = time.perf_counter()
+    async with db_connection(statement_timeout_ms) as conn:
+        cursor = await conn.execute(query, params)
+        rows = await cursor.fetchall()
+        columns = [column.name for column in cursor.description or []]
+    observe_db_query("internal", time.perf_counter() - start, len(rows))
+    return pd.DataFrame(rows, columns=columns)
+
+
+async def fetch_bounded_dataframe(
+    query: str,
+    max_rows: int = SQL_MAX_ROWS,
+    max_bytes: int = SQL_MAX_BYTES,
+    statement_timeout_ms: int = SQL_STATEMENT_TIMEOUT_MS,
+) -> tuple:
+    """
+    Run an untrusted (LLM-generated) query with bounded cost.
+    The transaction is read-only and every statement, including each fetch, is
+    limited by statement_timeout. Rows are streamed from a server-side cursor in
+    batches of SQL_FETCH_SIZE and reading stops at max_rows rows or max_bytes of
+    text, so neither a huge result nor a slow query can exhaust the worker.
+
+    Returns:
+    tuple: (DataFrame of the rows read, metadata dict with rows, truncated,
+    limit ("rows", "bytes" or None), max_rows and max_bytes)
+    """
+    start = time.perf_counter()
+    rows, nbytes, limit = [], 0, None
+    async with db_connection(statement_timeout_ms, read_only=True) as conn:
+        async with conn.cursor(name="generated_sql") as cursor:
+            await cursor.execute(query.strip().rstrip(";"))
+            columns = [column.name for column in cursor.description or []]
+            while limit is None:
+                batch = await cursor.fetchmany(SQL_FETCH_SIZE)
+                if not batch:
+                    break
+                for row in batch:
+                    if len(rows) == max_rows:
+                        limit = "rows"
+                        break
+                    # Size as the row will appear in the prompt
+                    nbytes += len(str(row))
+                    if nbytes > max_bytes:
+                        limit = "bytes"
+                        break
+                    rows.append(row)
+    observe_db_query("generated_sql", time.perf_counter() - start, len(rows))
+
+    metadata = {
+        "rows": len(rows),
+        "truncated": limit is not None,
+        "limit": limit,
+        "max_rows": max_rows,
+        "max_bytes": max_bytes,
+    }
+    return pd.DataFrame(rows, columns=columns), metadata
@@ -1,19 +1,18 @@
+import asyncio
+import functools
 import re
+from typing import Optional
 
 import pandas as pd
-import psycopg2
+from cache import LRUCache
 from data import *
+from db import fetch_dataframe
+from products import ensure_product_resolver, product_resolver
+from prompt_format import prompt_table
 from setup import *
 
-# Load data
-(
-    Mutual_Fund_Equity,
-    Mutual_Fund_Fixed_Income,
-    Mutual_Fund_Money_Market,
-    historical_transaction,
-    customer_data,
-    optimized_portfolio,
-) = load_data()
+# Datasets (customer_data, historical_transaction, optimized_portfolio, period_catalog, ...)
+# load lazily from data.datasets on first access; customer rows come from customer_index
 
 # Basic definitions
 additional_definitions = f"""
@@ -32,56 +31,94 @@ additional_definitions = f"""
 """
 
 
+# Cache of rendered per-customer prompts, keyed by
+# (function, customer_id, language, data_version) and bounded by entries and bytes
+prompt_cache = LRUCache(
+    maxsize=PROMPT_CACHE_SIZE, maxbytes=PROMPT_CACHE_MAX_BYTES, sizeof=len
+)
+
+
+# Decorator to memoize prompt builders that depend only on (customer_id, language)
+def cache_prompt(function):
+    def cache_key(customer_id, language):
+        return (function.__name__, customer_id, language, current_data_version())
+
+    if asyncio.iscoroutinefunction(function):
+
+        @functools.wraps(function)
+        async def async_wrapper(customer_id, language):
+            key = cache_key(customer_id, language)
+            prompt = prompt_cache.get(key)
+            if prompt is None:
+                prompt = await function(customer_id, language)
+                prompt_cache.set(key, prompt)
+            return prompt
+
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(customer_id, language):
+        key = cache_key(customer_id, language)
+        prompt = prompt_cache.get(key)
+        if prompt is None:
+            prompt = function(customer_id, language)
+            prompt_cache.set(key, prompt)
+        return prompt
+
+    return wrapper
+
+
 # Function to get the latest period columns
 def get_latest_period_columns():
-    # Get allocation columns from customer_data
-    cols = [i for i in customer_data.columns if i[0] == "%"]
-    # Find columns that match the pattern 'Q[1-4] 20[0-9]{2}$'
-    period_columns = [col for col in cols if re.search(r"Q[1-4] 20[0-9]{2}$", col)]
-    # Extract quarters and years
-    periods = [(col.split()[-2], int(col.split()[-1])) for col in period_columns]
-    # Find the latest period
-    latest_q, latest_year = max(periods, key=lambda x: (x[1], x[0]))
-    # Generate the latest period string
-    latest_period = f"{latest_q} {latest_year}"
+    period_catalog = datasets["period_catalog"]
+    latest_period, prev_period = period_catalog.yoy()
     # Create list of columns for the latest period
-    latest_columns = [
-        f"CASA {latest_period}",
-        f"Deposito {latest_period}",
-        f"AUM RD {latest_period}",
-        f"AUM SBN PERDANA {latest_period}",
-        f"AUM SBN SEKUNDER {latest_period}",
-        f"AUM BAC {latest_period}",
-        f"FBI RD {latest_period}",
-        f"FBI SBN PERDANA {latest_period}",
-        f"FBI SBN SEKUNDER {latest_period}",
-        f"FBI BAC {latest_period}",
-    ]
-    # Get previous year period
-    prev_year = latest_year - 1
-    prev_period = f"{latest_q} {prev_year}"
+    latest_columns = period_catalog.columns(period_metrics, latest_period)
     # Create list of columns for YoY comparison
-    yoy_columns = [
-        (f"CASA {latest_period}", f"CASA {prev_period}"),
-        (f"Deposito {latest_period}", f"Deposito {prev_period}"),
-        (f"AUM RD {latest_period}", f"AUM RD {prev_period}"),
-        (f"AUM SBN PERDANA {latest_period}", f"AUM SBN PERDANA {prev_period}"),
-        (f"AUM SBN SEKUNDER {latest_period}", f"AUM SBN SEKUNDER {prev_period}"),
-        (f"AUM BAC {latest_period}", f"AUM BAC {prev_period}"),
-        (f"FBI RD {latest_period}", f"FBI RD {prev_period}"),
-        (f"FBI SBN PERDANA {latest_period}", f"FBI SBN PERDANA {prev_period}"),
-        (f"FBI SBN SEKUNDER {latest_period}", f"FBI SBN SEKUNDER {prev_period}"),
-        (f"FBI BAC {latest_period}", f"FBI BAC {prev_period}"),
-    ]
+    yoy_columns = []
+    if prev_period is not None:
+        yoy_columns = list(
+            zip(latest_columns, period_catalog.columns(period_metrics, prev_period))
+        )
     return latest_columns, yoy_columns, latest_period
 
 
+# Number of quarters a question looks back, e.g. "last three months" -> 1, "past year" -> 4
+def get_lookback_quarters(question: str) -> int:
+    question = question.lower()
+    words = {
+        "one": 1,
+        "two": 2,
+        "three": 3,
+        "four": 4,
+        "six": 6,
+        "nine": 9,
+        "twelve": 12,
+    }
+    match = re.search(rf"(\d+|{'|'.join(words)})\s+(quarter|month|year)s?", question)
+    if match:
+        count = words.get(match.group(1)) or int(match.group(1))
+        unit = match.group(2)
+    elif "year" in question:
+        count, unit = 1, "year"
+    else:
+        # Default (including "last/previous month") to the previous quarter
+        count, unit = 1, "quarter"
+
+    if unit == "year":
+        return 4 * count
+    if unit == "month":
+        return max(1, -(-count // 3))
+    return max(1, count)
+
+
 # Function to present user profile
+@cache_prompt
 def present_customer_profile(customer_id: str, language: str) -> str:
-    data = customer_data[customer_data["BP Number WM Core"] == customer_id]
+    period_catalog = datasets["period_catalog"]
+    data = customer_index.rows("customer_data", customer_id)
     # Get latest columns and YoY columns
     _, yoy_columns, latest_period = get_latest_period_columns()
-    latest_period = "Q4 2023"
     fum_latest_period = [
         "usd_cur_casa_allocation",
         "usd_cur_bac_allocation",
@@ -91,15 +128,10 @@ def present_customer_profile(customer_id: str, language: str) -> str:
     ]
     total_fum = data[fum_latest_period].values.sum()
     fum_composition = data[fum_latest_period]
-    percent_cols = [i for i in data.columns if i[0] == "%"]
-    percent_cols_latest_period = [
-        i for i in percent_cols if " ".join(i.split(" ")[-2:]) == latest_period
-    ]
+    percent_cols_latest_period = period_catalog.period_columns(latest_period, "%")
     fum_composition_percentage = data[percent_cols_latest_period]
 
-    client_optimized_portfolio = optimized_portfolio[
-        optimized_portfolio["Customer ID"] == customer_id
-    ]
+    client_optimized_portfolio = customer_index.rows("optimized_portfolio", customer_id)
     current_return = client_optimized_portfolio["usd_current_expected_return"].sum()
     current_return_percentage = (
         client_optimized_portfolio["current_expected_return"].sum() * 100
@@ -131,7 +163,7 @@ def present_customer_profile(customer_id: str, language: str) -> str:
     for latest, previous in yoy_columns:
         use_columns.extend([latest, previous])
 
-    data = customer_data[customer_data["BP Number WM Core"] == customer_id][use_columns]
+    data = data[use_columns]
 
     # Generate prompt
     prompt = f"""
@@ -139,15 +171,15 @@ def present_customer_profile(customer_id: str, language: str) -> str:
     {additional_definitions}
 
     #### User Data ####
-    {data.to_dict(orient='records')}
+    {prompt_table(data)}
     ####
     
-    - Client Overview: describe in detail {overview.to_dict(orient='records')}. Highlight the Risk Profile.
+    - Client Overview: describe in detail {prompt_table(overview)}. Highlight the Risk Profile.
     - Current Total Asset: {total_fum}
     - Present client's asset composition in a table with the following columns:
         - "Investment Type": CASA, Deposito, BAC, RD, SB
-        - "Current Allocation (%)": {fum_composition_percentage.to_dict(orient='records')}
-        - "Current Allocation (USD)": {fum_composition.to_dict(orient='records')}
+        - "Current Allocation (%)": {prompt_table(fum_composition_percentage)}
+        - "Current Allocation (USD)": {prompt_table(fum_composition)}
      - YoY asset growth in the past year (mention the period) from "User Data" section. Present in table with columns: "Asset Type", "Growth (USD)", "Growth (%)". Elaborate. 
     - Explain risk tolerance based on propensity and score (3 is highest for each asset) in "User Data" section for RD, SB and BAC.
     - Ask for risk profile reassesment if:
@@ -164,50 +196,27 @@ def present_customer_profile(customer_id: str, language: str) -> str:
     return prompt
 
 
+# Transaction summary fields presented in prompts
+transaction_summary_columns = [
+    "Asset Type",
+    "Number of Transaction",
+    "Total Amount",
+    "Current Amount",
+    "Profit",
+    "Top Products",
+]
+
+
 # Function to present user performances from different periods
 def previous_period_performance(customer_id: str, language: str, question: str) -> str:
+    period_catalog = datasets["period_catalog"]
 
-    # Get the current period (assuming Q4 2023 is current)
-    current_quarter = "Q4"
-    current_year = 2023
-
-    # Parse the time period request
-    if "month" in question.lower():
-        # For monthly view, we'll use the previous quarter
-        if "last" in question.lower() or "previous" in question.lower():
-            previous_quarter = "Q3"
-            previous_year = current_year
-        elif "3" in question or "three" in question.lower():
-            previous_quarter = "Q2"
-            previous_year = current_year
-        elif "6" in question or "six" in question.lower():
-            previous_quarter = "Q1"
-            previous_year = current_year
-    elif "year" in question.lower():
-        previous_quarter = current_quarter
-        previous_year = current_year - 1
-    else:
-        # Default to previous quarter
-        previous_quarter = "Q3"
-        previous_year = current_year
-
-    previous_period = f"{previous_quarter} {previous_year}"
-    period_columns = [
-        f"CASA {previous_period}",
-        f"Deposito {previous_period}",
-        f"AUM RD {previous_period}",
-        f"AUM SBN PERDANA {previous_period}",
-        f"AUM SBN SEKUNDER {previous_period}",
-        f"AUM BAC {previous_period}",
-        f"FBI RD {previous_period}",
-        f"FBI SBN PERDANA {previous_period}",
-        f"FBI SBN SEKUNDER {previous_period}",
-        f"FBI BAC {previous_period}",
-    ]
+    # Resolve the requested period from the catalog
+    previous_period = period_catalog.back(get_lookback_quarters(question))
+    previous_quarter, previous_year = previous_period.split()
+    period_columns = period_catalog.columns(period_metrics, previous_period)
     # Get master data of customer for the period
-    data = customer_data[customer_data["BP Number WM Core"] == customer_id][
-        period_columns
-    ]
+    data = customer_index.rows("customer_data", customer_id)[period_columns]
 
     # Calculate metrics for the period
     total_fum = data[period_columns[:6]].values.sum()
@@ -224,19 +233,16 @@ def previous_period_performance(customer_id: str, language: str, question: str)
         * 0.06
     )
 
-    # Get recent purchases
-    data_hist = historical_transaction[
-        historical_transaction["Customer ID"] == customer_id
-    ]
-    data_hist = data_hist[
-        (data_hist["Quarter"] == "Q3") & (data_hist["Year"] == "2023")
-    ]
-    recent_purchases = data_hist["Product Name"].value_counts().to_frame()
+    # Get recent purchases from the pre-aggregated transaction summary
+    summary = customer_index.rows("transaction_summary", customer_id)
+    recent_purchases = summary[
+        (summary["Quarter"] == previous_quarter) & (summary["Year"] == previous_year)
+    ][transaction_summary_columns]
 
     # Get optimized portfolio
-    cur_opt_portfolio = optimized_portfolio[
-        optimized_portfolio["Customer ID"] == customer_id
-    ][["asset_type", "recommended_allocation"]]
+    cur_opt_portfolio = customer_index.rows("optimized_portfolio", customer_id)[
+        ["asset_type", "recommended_allocation"]
+    ]
 
     # Generate prompt
     prompt = f"""
@@ -244,19 +250,19 @@ def previous_period_performance(customer_id: str, language: str, question: str)
     {additional_definitions}
 
     #### User Data for {previous_period} ####
-    {data.to_dict(orient='records')}
+    {prompt_table(data)}
     ####
     
     - Do not mention any month and/or year. Just mention what the query asks (for example: last month, last three months, last year)
     - Customer's Total Asset in the month/year: {total_fum}
     - Present client's asset composition in a table with the following columns:
         - "Investment Type": CASA, Deposito, BAC, RD, SB Perdana, SB Sekunder
-        - "Previous Allocation (USD)": {fum_composition.to_dict(orient='records')}
+        - "Previous Allocation (USD)": {prompt_table(fum_composition)}
     - Show the realized return from FUM composition: 
         - {previous_return} in USD
     - FBI in the month/year: {fbi_composition}
-    - In table format, compare their allocation with the recommended allocation: {cur_opt_portfolio.to_dict(orient='records')}. Explain the difference.
-    - In table form, present the product names and count of products of recent purchases: {recent_purchases}. Analyze the customer's preferences.
+    - In table format, compare their allocation with the recommended allocation: {prompt_table(cur_opt_portfolio)}. Explain the difference.
+    - In table form, present the product names and count of products of recent purchases (per asset type): {prompt_table(recent_purchases)}. Analyze the customer's preferences.
         If none, explain that the client has not made any purchases in the past month.
     - Explain how the client's performance on the previous period.
     - Replace BAC with the word Banca, SB Perdana with the word Primary Bonds, SB Sekunder with the word Secondary Bonds, and RD with the word Mutual Fund.
@@ -265,13 +271,12 @@ def previous_period_performance(customer_id: str, language: str, question: str)
 
 
 # Function to present optimized portfolio
+@cache_prompt
 def present_optimized_portfolio(customer_id: str, language: str) -> str:
     # Generate required data
     use_columns, _, latest_period = get_latest_period_columns()
-    data = customer_data[customer_data["BP Number WM Core"] == customer_id][use_columns]
-    client_optimized_portfolio = optimized_portfolio[
-        optimized_portfolio["Customer ID"] == customer_id
-    ]
+    data = customer_index.rows("customer_data", customer_id)[use_columns]
+    client_optimized_portfolio = customer_index.rows("optimized_portfolio", customer_id)
     total_current_asset = (
         data["CASA " + latest_period]
         + data["Deposito " + latest_period]
@@ -306,7 +311,7 @@ def present_optimized_portfolio(customer_id: str, language: str) -> str:
     {additional_definitions}
 
     #### Portfolio Optimization ####
-    {client_optimized_portfolio[used_columns].to_dict(orient='records')}
+    {prompt_table(client_optimized_portfolio[used_columns])}
     ####
 
     - Show and highlight total asset in USD: {total_current_asset}
@@ -330,8 +335,14 @@ def present_optimized_portfolio(customer_id: str, language: str) -> str:
 
 
 # Function to present client's past behaviour (historical transaction)
+@cache_prompt
 def present_historical_transaction(customer_id: str, language: str) -> str:
-    data = historical_transaction[historical_transaction["Customer ID"] == customer_id][
+    # Quarterly summary per asset type plus the largest transactions, both
+    # pre-aggregated at load time, so long histories cost the same as short ones
+    summary = customer_index.rows("transaction_summary", customer_id)[
+        ["Year", "Quarter"] + transaction_summary_columns
+    ]
+    top_transactions = customer_index.rows("transaction_top_rows", customer_id)[
         [
             "Product Name",
             "Product Type",
@@ -348,11 +359,15 @@ def present_historical_transaction(customer_id: str, language: str) -> str:
     {additional_definitions}
     Assume that current month is 
 
-    #### Historical Transaction ####
-    {data.to_dict(orient='records')}
+    #### Transaction Summary per Quarter and Asset Type ####
+    {prompt_table(summary)}
     ####
 
-    - Present historical transaction in table.
+    #### Largest Transactions ####
+    {prompt_table(top_transactions)}
+    ####
+
+    - Present the historical transaction summary per quarter in a table, and list the largest transactions.
     - Replace BAC with the word Banca, SB with the word Bonds, SB Perdana with the word Primary Bonds, SB Sekunder with the word Secondary Bonds, and RD with the word Mutual Fund.
     - What is the behavior of the client?
     - What funds are the client interested in?
@@ -360,59 +375,102 @@ def present_historical_transaction(customer_id: str, language: str) -> str:
     return prompt
 
 
+# Product catalog fields presented for recommended products
+product_detail_columns = [
+    "Product Name",
+    "Fund Category",
+    "Risk Level",
+    "1 Year Return",
+    "YTD",
+    "Since Inception",
+    "Asset Allocation as of Reporting Date",
+    "Minimum Initial Subscription",
+    "Management Fee",
+]
+
+
+# Look up recommended products in product_data when the resolver isn't loaded
+async def fetch_product_details(recommended_products: pd.DataFrame) -> pd.DataFrame:
+    # Collect LIKE patterns for every recommended product, in recommendation order
+    asset_types, patterns, spaced_patterns = [], [], []
+    for _, row in recommended_products.iterrows():
+        for col in ["product_1", "product_2", "product_3"]:
+            if pd.notna(row[col]):
+                # Clean product name for matching
+                product_name = row[col].replace("(", "").replace(")", "").strip()
+                asset_types.append(row["asset_type"])
+                patterns.append(f"%{product_name.upper()}%")
+                spaced_patterns.append(f"%{product_name.upper().replace(' ', '%')}%")
+    if not patterns:
+        return pd.DataFrame()
+
+    # Resolve all product details in one round trip: product names are normalized
+    # once in a materialized CTE and joined against the unnested pattern list
+    query = """
+    WITH products AS MATERIALIZED (
+        SELECT "Product Name", "Fund Category", "Risk Level",
+               "1 Year Return", "YTD", "Since Inception", "Asset Allocation as of Reporting Date",
+               "Minimum Initial Subscription", "Management Fee",
+               REPLACE(REPLACE(UPPER("Product Name"), '(', ''), ')', '') AS normalized_name
+        FROM product_data
+    )
+    SELECT p."Product Name", p."Fund Category", p."Risk Level",
+           p."1 Year Return", p."YTD", p."Since Inception", p."Asset Allocation as of Reporting Date",
+           p."Minimum Initial Subscription", p."Management Fee",
+           r.asset_type AS "Asset Type"
+    FROM unnest(%s::text[], %s::text[], %s::text[])
+         WITH ORDINALITY AS r(asset_type, pattern, spaced_pattern, ordinal)
+    JOIN products p
+      ON p.normalized_name LIKE r.pattern
+      OR p.normalized_name LIKE r.spaced_pattern
+    ORDER BY r.ordinal
+    """
+    return await fetch_dataframe(query, (asset_types, patterns, spaced_patterns))
+
+
 # Function to recommend products for the client
-def present_recommended_products(customer_id: str, language: str) -> str:
+@cache_prompt
+async def present_recommended_products(customer_id: str, language: str) -> str:
     # Get optimized portfolio recommendations
-    client_optimized_portfolio = optimized_portfolio[
-        optimized_portfolio["Customer ID"] == customer_id
-    ]
+    client_optimized_portfolio = customer_index.rows("optimized_portfolio", customer_id)
     recommended_products = client_optimized_portfolio[
         ["asset_type", "product_1", "product_2", "product_3"]
     ]
 
-    # Connect to PostgreSQL database
-    conn = psycopg2.connect(DATABASE_URL)
-
-    # Get product details for each recommended product
-    product_details = []
-    for _, row in recommended_products.iterrows():
-        for col in ["product_1", "product_2", "product_3"]:
-            if pd.notna(row[col]):
-                # Clean product name for matching
-                product_name = row[col].replace("(", "").replace(")", "").strip()
-                # Query product details from database
-                query = f"""
-                SELECT "Product Name", "Fund Category", "Risk Level", 
-                       "1 Year Return", "YTD", "Since Inception", "Asset Allocation as of Reporting Date",
-                       "Minimum Initial Subscription", "Management Fee"
-                FROM product_data 
-                WHERE REPLACE(REPLACE(UPPER("Product Name"), '(', ''), ')', '') 
-                LIKE '%{product_name.upper()}%'
-                OR REPLACE(REPLACE(UPPER("Product Name"), '(', ''), ')', '')
-                LIKE '%{product_name.upper().replace(" ", "%")}%'
-                """
-                product_info = pd.read_sql_query(query, conn)
-                if not product_info.empty:
-                    product_info["Asset Type"] = row["asset_type"]
-                    product_details.append(product_info)
-
-    conn.close()
-
-    # Combine all product details into a single DataFrame
-    if product_details:
-        all_product_details = pd.concat(product_details, ignore_index=True)
+    # Resolve every recommended product against the in-memory product catalog
+    try:
+        resolver = await ensure_product_resolver()
+    except Exception:
+        # Loading the whole catalog failed; the batched query below still
+        # raises if the database itself is down
+        resolver = product_resolver
+    if not resolver.is_loaded:
+        all_product_details = await fetch_product_details(recommended_products)
     else:
-        all_product_details = pd.DataFrame()
+        product_details = []
+        for _, row in recommended_products.iterrows():
+            for col in ["product_1", "product_2", "product_3"]:
+                if pd.notna(row[col]):
+                    for position, _ in resolver.resolve(row[col]):
+                        product_details.append(
+                            {
+                                **resolver.products.loc[
+                                    position, product_detail_columns
+                                ].to_dict(),
+                                "Asset Type": row["asset_type"],
+                            }
+                        )
+        all_product_details = pd.DataFrame(product_details)
 
     prompt = f"""
     Answer in {language}.
     {additional_definitions}
 
     #### Recommended Products ####
-    {recommended_products.to_dict(orient='records')}
+    {prompt_table(recommended_products)}
 
     #### Product Details ####
-    {all_product_details.to_dict(orient='records')}
+    {prompt_table(all_product_details)}
     ####
 
     - Replace BAC with the word Banca, SB with the word Bonds, SB Perdana with the word Primary Bonds, SB Sekunder with the word Secondary Bonds, and RD with the word Mutual Fund.
@@ -439,9 +497,7 @@ def present_recommended_products(customer_id: str, language: str) -> str:
 
 # Function to get new allocation
 def get_new_allocation(customer_id: str, question: str):
-    client_optimized_portfolio = optimized_portfolio[
-        optimized_portfolio["Customer ID"] == customer_id
-    ]
+    client_optimized_portfolio = customer_index.rows("optimized_portfolio", customer_id)
     current_allocation = client_optimized_portfolio[["asset_type", "cur_allocation"]]
     current_asset = client_optimized_portfolio["usd_current_allocation"].sum()
 
@@ -470,12 +526,8 @@ def present_new_portfolio(
     RD_allocation: float,
     SB_allocation: float,
 ) -> str:
-    data = customer_data[customer_data["BP Number WM Core"] == customer_id][
-        ["BAC", "SB", "RD"]
-    ]
-    client_optimized_portfolio = optimized_portfolio[
-        optimized_portfolio["Customer ID"] == customer_id
-    ]
+    data = customer_index.rows("customer_data", customer_id)[["BAC", "SB", "RD"]]
+    client_optimized_portfolio = customer_index.rows("optimized_portfolio", customer_id)
     current_allocation = client_optimized_portfolio[
         ["asset_type", "cur_allocation", "usd_current_allocation"]
     ]
@@ -500,7 +552,7 @@ def present_new_portfolio(
     {additional_definitions}
     
     #### Current Allocation ####
-    {current_allocation.to_dict(orient='records')}
+    {prompt_table(current_allocation)}
     ####
 
     #### Adjusted Allocation ####
@@ -536,6 +588,26 @@ def present_new_portfolio(
 
 # Function to generate SQL syntax for fund details
 def generate_sql_syntax_product_data(question: str) -> str:
+    # Product names resolved in memory are matched exactly; LIKE is only the
+    # fallback when the resolver isn't loaded or found no product in the question
+    resolved_products = (
+        product_resolver.mentions(question) if product_resolver.is_loaded else []
+    )
+    if resolved_products:
+        quoted_names = ", ".join(
+            "'" + name.replace("'", "''") + "'" for name in resolved_products
+        )
+        product_rule = f"""6. Product names in the question resolve to these exact catalog names: {quoted_names}. Match them with "Product Name" IN (...) using these exact names, do not use LIKE"""
+        product_example = f"""
+    Example of product name matching:
+    WHERE "Product Name" IN ({quoted_names})"""
+    else:
+        product_rule = "6. Consider possible typos or incomplete product names in the question and use LIKE to find similar matches"
+        product_example = """
+    Example of flexible product name matching:
+    WHERE REPLACE(REPLACE(UPPER("Product Name"), '(', ''), ')', '') LIKE '%PRODUCT_NAME%'
+    OR REPLACE(REPLACE(UPPER("Product Name"), '(', ''), ')', '') LIKE '%PRODUCT_NAME_WITHOUT_SPACES%'"""
+
     prompt = f"""
     Rules:
     1. Return ONLY the SQL query, nothing else
@@ -543,17 +615,14 @@ def generate_sql_syntax_product_data(question: str) -> str:
     3. Use proper SQL syntax for SQLite
     4. If the query is asking for list of products, order by Fund category and then by Risk Level and 1 Year Return in descending order
     5. When the query is asking for products comparison, use all available information.
-    6. Consider possible typos or incomplete product names in the question and use LIKE to find similar matches
+    {product_rule}
     Given these SQLite table schemas:
     {table_schemas_product_data}
     Generate a SQL query to answer this question: {question} by following the rules.
     If not specified, important fields to show: Product Name, Fund Category, Effective Date, Risk Level, 1 Year Return, Since Inception. Avoid selecting all fields.
     Give analysis on which customers are most likely to invest in the product, by risk profile and preferences.
     Return list in table format.
-
-    Example of flexible product name matching:
-    WHERE REPLACE(REPLACE(UPPER("Product Name"), '(', ''), ')', '') LIKE '%PRODUCT_NAME%'
-    OR REPLACE(REPLACE(UPPER("Product Name"), '(', ''), ')', '') LIKE '%PRODUCT_NAME_WITHOUT_SPACES%'
+    {product_example}
     """
     return prompt
 
@@ -577,12 +646,24 @@ def generate_sql_syntax_customer_transaction(question: str) -> str:
 
 
 # Function to present SQL results
-def present_sql_results(results: pd.DataFrame, language: str) -> str:
+def present_sql_results(
+    results: pd.DataFrame, language: str, truncation: Optional[dict] = None
+) -> str:
+    # Tell the model when the result was cut at the row or byte cap
+    truncation_note = ""
+    if truncation and truncation["truncated"]:
+        truncation_note = (
+            f"Only the first {truncation['rows']} rows are shown; the query returned more "
+            f"(limit: {truncation['max_rows']} rows / {truncation['max_bytes']} bytes). "
+            "Say that the list is partial and do not present totals or rankings as complete."
+        )
+
     # Convert results to string format and append to prompt
     prompt = f"""
     Answer in {language}.
     Results found:
-    {results.to_dict(orient='records')}
+    {prompt_table(results)}
+    {truncation_note}
     Present data in an engaging and organized way. 
     Present all found results. Split to some tables if necessary. Elaborate on the data and provide insights.
     Highlight this in bold red: "Please use dashboard to see all data, because this response will be cut short due to the size of the data."
@@ -599,42 +680,37 @@ def filter_customers_region(question: str, language: str) -> str:
     Filters: region, area
     """
 
-    # Create base DataFrame with required columns
-    data = customer_data[
-        [
-            "BP Number WM Core",
-            "Region Number",
-            "Region Name",
-            "Nama Area",
-            "Risk Profile",
-            "Priority_Private",
-            "AUM Q4 2023",
-        ]
+    # Rank by the AUM of the quarter named in the question, else the latest one
+    period_catalog = datasets["period_catalog"]
+    match = re.search(r"\b(Q[1-4])\s*(20\d{2})\b", question, re.IGNORECASE)
+    period = f"{match.group(1).upper()} {match.group(2)}" if match else None
+    # The catalog tracks quarters by period_metrics, which doesn't include the
+    # total AUM, so only quarters with an "AUM <quarter>" column can be ranked
+    customer_columns = datasets["customer_data"].columns
+    aum_quarters = [
+        quarter
+        for quarter in period_catalog.quarters
+        if f"AUM {quarter}" in customer_columns
     ]
+    if period not in aum_quarters:
+        period = aum_quarters[-1] if aum_quarters else period_catalog.latest
+    aum_column = f"AUM {period}"
 
     # Extract number for top N from the question (default to 5 if not specified)
     match = re.search(r"top\s+(\d+)", question.lower())
     top_n = int(match.group(1)) if match else 5
 
-    # Apply filters based on the question
-
-    region_number = data["Region Number"].unique()
-    for region in region_number:
-        if re.search(rf"\b{str(region).lower()}\b", question.lower()):
-            data = data[data["Region Number"] == region]
-
-    region_name = data["Region Name"].unique()
-    for region in region_name:
-        if re.search(rf"\b{str(region).lower()}\b", question.lower()):
-            data = data[data["Region Name"] == region]
-
-    areas = data["Nama Area"].unique()
-    for area in areas:
-        if str(area).lower() in question.lower():
-            data = data[data["Nama Area"] == area]
-
-    # Get top N customers by AUM
-    result_df = data.nlargest(top_n, "AUM Q4 2023")[
+    # Apply the region/area filters named in the question and slice the ranking.
+    # The top N and the quarter are removed first, so their numbers aren't read
+    # as Region Numbers ("top 3 customers in Jakarta 1" is not region 3)
+    region_index = datasets["region_index"]
+    filters = region_index.match(
+        re.sub(r"\btop\s+\d+|\bQ[1-4]\s*20\d{2}\b", " ", question, flags=re.I)
+    )
+    result_df = region_index.top(
+        filters,
+        aum_column,
+        top_n,
         [
             "BP Number WM Core",
             "Region Number",
@@ -642,16 +718,26 @@ def filter_customers_region(question: str, language: str) -> str:
             "Nama Area",
             "Risk Profile",
             "Priority_Private",
-            "AUM Q4 2023",
-        ]
-    ]
+            aum_column,
+        ],
+    )
+
+    if result_df.empty:
+        filter_text = ", ".join(
+            f"{column} {value}" for column, value in filters.items()
+        )
+        return f"""
+        Answer in {language}.
+        No customers were found for {filter_text or "the requested filters"} in {period}.
+        Tell the user that no customers match, and ask if they want to try a different region or area.
+        """
 
     prompt = f"""
         Answer in {language}.
         {additional_definitions}
         
         #### Filtered Customer List ####
-        {result_df.to_dict(orient='records')}
+        {prompt_table(result_df)}
         
         Present the top {top_n} customers in a table with:
         - Customer ID: {result_df['BP Number WM Core'].values[0]}
@@ -659,7 +745,7 @@ def filter_customers_region(question: str, language: str) -> str:
         - Area: {result_df['Nama Area'].values[0]}
         - Risk Profile: {result_df['Risk Profile'].values[0]}
         - Segment (Priority/Private): {result_df['Priority_Private'].values[0]}
-        - Total AUM (use K, M, B notation): {result_df['AUM Q4 2023'].values[0]}
+        - Total AUM in {period} (use K, M, B notation): {result_df[aum_column].values[0]}
         
         Highlight any notable patterns or concentrations in the data.
         Ask if user wants to:
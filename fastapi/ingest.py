@@ -0,0 +1,178 @@
+import io
+import itertools
+import logging
+import os
+import time
+from typing import Iterable, Optional
+
+import pandas as pd
+import psycopg
+import pyarrow as pa
+from psycopg import sql
+from psycopg.types.json import Jsonb
+from pyarrow import csv
+from setup import DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Rows read from a source file and sent through COPY at a time
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "100000"))
+
+# Metadata table recording the source file fingerprint each table was loaded from
+create_ingestion_manifest = """
+    CREATE TABLE IF NOT EXISTS ingestion_manifest (
+        table_name TEXT PRIMARY KEY,
+        source JSONB NOT NULL,
+        rows BIGINT NOT NULL,
+        loaded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+
+# PostgreSQL column type for a pandas dtype, as DataFrame.to_sql would choose it
+def postgres_type(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "BIGINT"
+    if pd.api.types.is_float_dtype(dtype):
+        return "DOUBLE PRECISION"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP"
+    return "TEXT"
+
+
+# Cast a chunk to the target column types so every chunk encodes the same way
+def _conform(chunk: pd.DataFrame, column_types: dict) -> pd.DataFrame:
+    chunk = chunk.copy()
+    for column, column_type in column_types.items():
+        if column_type == "BIGINT":
+            # Integer columns read as float when a chunk has gaps (e.g. "1006299.0")
+            chunk[column] = pd.to_numeric(chunk[column]).astype("Int64")
+        elif column_type in ("DOUBLE PRECISION", "FLOAT"):
+            chunk[column] = pd.to_numeric(chunk[column])
+        elif column_type == "TEXT" and chunk[column].dtype == object:
+            # Excel cells can mix numbers and text in one column
+            chunk[column] = chunk[column].where(
+                chunk[column].isna(), chunk[column].astype(str)
+            )
+    return chunk
+
+
+# Encode a chunk as headerless CSV for COPY; nulls become unquoted empty fields
+def _encode_csv(chunk: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    csv.write_csv(
+        pa.Table.from_pandas(chunk, preserve_index=False),
+        buffer,
+        csv.WriteOptions(include_header=False),
+    )
+    return buffer.getvalue()
+
+
+# Fingerprints of the source files of the loaded tables, by table name
+def read_ingestion_manifest() -> dict:
+    with psycopg.connect(DATABASE_URL) as conn, conn.cursor() as cursor:
+        cursor.execute(create_ingestion_manifest)
+        # Entries whose table was dropped since don't count, so it gets loaded again
+        cursor.execute(
+            "SELECT table_name, source FROM ingestion_manifest "
+            "WHERE to_regclass(quote_ident(table_name)) IS NOT NULL"
+        )
+        return dict(cursor.fetchall())
+
+
+# Update the recorded fingerprint of an unchanged source (e.g. only its mtime moved)
+def update_ingestion_manifest(table: str, source: dict):
+    with psycopg.connect(DATABASE_URL) as conn:
+        conn.execute(
+            "UPDATE ingestion_manifest SET source = %s WHERE table_name = %s",
+            (Jsonb(source), table),
+        )
+
+
+def copy_chunks_to_postgres(
+    table: str,
+    chunks: Iterable[pd.DataFrame],
+    column_types: Optional[dict] = None,
+    source: Optional[dict] = None,
+) -> dict:
+    """
+    Stream DataFrame chunks into a table with COPY FROM STDIN, so only one chunk
+    is in memory at a time and rows skip per-statement INSERT overhead.
+    Rows are copied into a staging table created in the same transaction; once
+    every chunk is in, the old table is dropped and the staging table renamed
+    to it. The swap commits atomically, so readers see either the previous table
+    or the complete new one. On any error the transaction rolls back and the
+    current table is left untouched.
+
+    Parameters:
+    table (str): Target table name
+    chunks (Iterable[pd.DataFrame]): Chunks with the target columns, in order
+    column_types (dict): {column: PostgreSQL type}; default from the first chunk's dtypes
+    source (dict): Source file fingerprint, recorded in the ingestion manifest on commit
+
+    Returns:
+    dict: table, rows, seconds and rows_per_second of the load
+    """
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError(f"No rows to load into {table}")
+    column_types = column_types or {
+        column: postgres_type(dtype) for column, dtype in first.dtypes.items()
+    }
+    staging = sql.Identifier(f"{table}__staging")
+    columns = sql.SQL(", ").join(map(sql.Identifier, column_types))
+
+    start = time.perf_counter()
+    rows = 0
+    with psycopg.connect(DATABASE_URL) as conn, conn.cursor() as cursor:
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(staging))
+        cursor.execute(
+            sql.SQL("CREATE TABLE {} ({})").format(
+                staging,
+                sql.SQL(", ").join(
+                    sql.SQL("{} {}").format(sql.Identifier(column), sql.SQL(kind))
+                    for column, kind in column_types.items()
+                ),
+            )
+        )
+        copy_statement = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)")
+        with cursor.copy(copy_statement.format(staging, columns)) as copy:
+            for chunk in itertools.chain([first], chunks):
+                copy.write(_encode_csv(_conform(chunk, column_types)))
+                rows += len(chunk)
+                logger.debug(f"Copied {rows:,} rows into {table}__staging")
+
+        # The swap and the manifest entry commit together with the copied rows
+        cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table)))
+        cursor.execute(
+            sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                staging, sql.Identifier(table)
+            )
+        )
+        if source is not None:
+            cursor.execute(create_ingestion_manifest)
+            cursor.execute(
+                """
+                INSERT INTO ingestion_manifest (table_name, source, rows)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (table_name) DO UPDATE SET source = EXCLUDED.source,
+                    rows = EXCLUDED.rows, loaded_at = now()
+                """,
+                (table, Jsonb(source), rows),
+            )
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "table": table,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+    }
+    logger.info(
+        f"Loaded {rows:,} rows into {table} in {seconds:.2f} s "
+        f"({stats['rows_per_second']:,.0f} rows/s)"
+    )
+    return stats
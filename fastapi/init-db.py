@@ -4,6 +4,7 @@ Database initialization script for FastAPI container
 This script runs when the container starts to ensure the database is properly set up
 """
 
+import argparse
 import os
 import time
 
@@ -84,18 +85,21 @@ def create_database():
     return True
 
 
-def populate_database():
-    """Populate the database with data"""
+def populate_database(force=False):
+    """Populate the database with the data files that changed since the last load"""
     try:
         print("📊 Populating database with data...")
-        from data import (
-            input_customer_transaction_to_postgres,
-            input_product_data_to_postgres,
-        )
+        from data import ingest_changed_sources
 
         # Run the data population functions
-        input_product_data_to_postgres()
-        input_customer_transaction_to_postgres()
+        for stats in ingest_changed_sources(force=force):
+            if stats.get("skipped"):
+                print(f"   {stats['table']}: source unchanged, skipped")
+                continue
+            print(
+                f"   {stats['table']}: {stats['rows']:,} rows in {stats['seconds']:.1f} s "
+                f"({stats['rows_per_second']:,.0f} rows/s)"
+            )
 
         print("✅ Database populated successfully!")
         return True
@@ -104,7 +108,48 @@ def populate_database():
         return False
 
 
+def build_data_snapshot(force=False):
+    """Build the columnar snapshot of the data files for fast API startup"""
+    try:
+        print("📦 Checking data snapshot...")
+        from data import ensure_snapshot
+
+        _, rebuilt = ensure_snapshot(force=force)
+
+        if rebuilt:
+            print("✅ Data snapshot built successfully!")
+        else:
+            print("✅ Data snapshot is up to date, skipped")
+        return True
+    except Exception as e:
+        print(f"❌ Error building data snapshot: {e}")
+        return False
+
+
+def publish_shared_data():
+    """Publish the datasets to shared memory for the API workers"""
+    try:
+        print("🧠 Publishing datasets to shared memory...")
+        from data import publish_shared_datasets
+
+        publish_shared_datasets()
+
+        print("✅ Datasets published successfully!")
+        return True
+    except Exception as e:
+        print(f"❌ Error publishing datasets: {e}")
+        return False
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Initialize the FastAPI database")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="reload every table and rebuild the snapshot even if the source files are unchanged",
+    )
+    args = parser.parse_args()
+
     print("🚀 Starting FastAPI database initialization...")
 
     # Wait for PostgreSQL to be ready
@@ -116,7 +161,15 @@ if __name__ == "__main__":
         exit(1)
 
     # Populate database
-    if not populate_database():
+    if not populate_database(force=args.force):
         print("⚠️  Database population failed, but continuing...")
 
+    # Build data snapshot
+    if not build_data_snapshot(force=args.force):
+        print("⚠️  Data snapshot build failed, API will load the source files...")
+
+    # Publish datasets to shared memory
+    if os.getenv("SHARED_DATA_DIR") and not publish_shared_data():
+        print("⚠️  Publishing datasets failed, each worker will load its own copy...")
+
     print("✅ Database initialization completed!")
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stub of the /chat/completions subset main.py uses, for
+load tests that don't spend OpenRouter tokens.
+
+- Tool calls: picks the tool whose example questions best match the last user
+  message, by word overlap with the descriptions sent in `tools`
+- Structured output (`json_schema`, used by `beta.chat.completions.parse`) and
+  JSON mode (`json_object`): a JSON object with the requested keys
+- Streaming: Server-Sent Events at a fixed token rate
+
+Usage:
+    python llm_stub.py --port 8100 --latency 0.4 --tokens-per-second 80
+    OPENROUTER_API_KEY=stub OPENROUTER_BASE_URL=http://127.0.0.1:8100/v1 uvicorn main:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI()
+
+# Replaced by the command-line arguments in __main__
+config = argparse.Namespace(
+    latency=0.3,
+    jitter=0.5,
+    structured_latency=0.0,
+    structured_failure_rate=0.0,
+    tokens_per_second=60.0,
+    answer_tokens=150,
+    seed=None,
+)
+
+answer_words = (
+    "Great! Let's dive deep into the client's portfolio. The current allocation "
+    "leans towards deposits, while the optimized plan shifts part of it into "
+    "mutual funds and bonds to improve the risk-adjusted return. Would you like "
+    "to compare the recommended products or simulate another allocation?"
+).split()
+
+
+# Time to first byte of a response: the configured latency with uniform jitter
+async def think(extra: float = 0.0):
+    spread = config.latency * config.jitter
+    await asyncio.sleep(
+        max(0.0, config.latency + random.uniform(-spread, spread)) + extra
+    )
+
+
+def words(text: str) -> set:
+    return set(re.findall(r"[a-z0-9%]+", text.lower()))
+
+
+# Tool whose example questions share the most words with the question
+def route(question: str, tools: list):
+    question_words = words(question)
+    best, best_score = None, 0.0
+    for tool in tools:
+        function = tool["function"]
+        _, _, examples = function.get("description", "").partition("questions:")
+        for example in examples.split(","):
+            example_words = words(example)
+            if not example_words:
+                continue
+            score = len(question_words & example_words) / len(
+                question_words | example_words
+            )
+            if score > best_score:
+                best, best_score = function["name"], score
+    return best if best_score >= 0.2 else None
+
+
+# Value of the type a JSON schema property asks for
+def fake_value(name: str, schema: dict, prompt: str):
+    kind = schema.get("type")
+    if kind in ("number", "integer"):
+        return round(random.uniform(0.0, 0.3), 2)
+    if kind == "boolean":
+        return True
+    if "sql" in name.lower():
+        table = (
+            "customer_transaction"
+            if "customer_transaction" in prompt
+            else "product_data"
+        )
+        return f"SELECT * FROM {table} LIMIT 10"
+    return "stub"
+
+
+# Object with the keys of the format a JSON-mode prompt asks for
+def fake_json_mode(prompt: str) -> dict:
+    match = re.search(r"exact format: (\{.*\})", prompt)
+    template = json.loads(match.group(1)) if match else {}
+    return {
+        key: fake_value(
+            key, {"type": "number" if isinstance(value, float) else "string"}, prompt
+        )
+        for key, value in template.items()
+    }
+
+
+def completion(body: dict, message: dict, finish_reason: str = "stop") -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def chunk(chunk_id: str, body: dict, delta: dict, finish_reason=None) -> str:
+    payload = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+# Stream answer_tokens words as SSE chunks at tokens_per_second
+async def stream_answer(body: dict):
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    await think()
+    yield chunk(chunk_id, body, {"role": "assistant", "content": ""})
+    interval = 1 / config.tokens_per_second if config.tokens_per_second else 0.0
+    for i in range(config.answer_tokens):
+        await asyncio.sleep(interval)
+        word = answer_words[i % len(answer_words)]
+        yield chunk(chunk_id, body, {"content": f"{word} "})
+    yield chunk(chunk_id, body, {}, finish_reason="stop")
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    prompt = "\n".join(str(m.get("content") or "") for m in messages)
+
+    if body.get("stream"):
+        return StreamingResponse(stream_answer(body), media_type="text/event-stream")
+
+    if body.get("tools"):
+        await think()
+        question = next(
+            (m["content"] for m in reversed(messages) if m.get("role") == "user"), ""
+        )
+        name = route(question, body["tools"])
+        if name is None:
+            return completion(body, {"role": "assistant", "content": "Hello!"})
+        tool_call = {
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {"name": name, "arguments": "{}"},
+        }
+        return completion(
+            body,
+            {"role": "assistant", "content": None, "tool_calls": [tool_call]},
+            "tool_calls",
+        )
+
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        await think(config.structured_latency)
+        if random.random() < config.structured_failure_rate:
+            # Flaky providers answer with text that doesn't match the schema
+            content = "Sorry, I can only answer in plain text."
+            return completion(body, {"role": "assistant", "content": content})
+        schema = response_format["json_schema"]["schema"]
+        content = {
+            name: fake_value(name, prop, prompt)
+            for name, prop in schema.get("properties", {}).items()
+        }
+        return completion(body, {"role": "assistant", "content": json.dumps(content)})
+    if response_format.get("type") == "json_object":
+        await think()
+        content = json.dumps(fake_json_mode(prompt))
+        return completion(body, {"role": "assistant", "content": content})
+
+    await think()
+    content = " ".join(answer_words[: config.answer_tokens])
+    return completion(body, {"role": "assistant", "content": content})
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument(
+        "--latency", type=float, default=config.latency, help="seconds to first byte"
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=config.jitter,
+        help="latency spread, as a fraction of --latency",
+    )
+    parser.add_argument(
+        "--structured-latency",
+        type=float,
+        default=config.structured_latency,
+        help="extra seconds for structured-output (json_schema) calls",
+    )
+    parser.add_argument(
+        "--structured-failure-rate",
+        type=float,
+        default=config.structured_failure_rate,
+        help="share of structured-output calls answered with text that fails validation",
+    )
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=config.tokens_per_second
+    )
+    parser.add_argument("--answer-tokens", type=int, default=config.answer_tokens)
+    parser.add_argument("--seed", type=int)
+    config = parser.parse_args()
+    random.seed(config.seed)
+
+    uvicorn.run(app, host=config.host, port=config.port, log_level="warning")
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Load generator for /api_chat: a closed loop of concurrent chats at increasing
+concurrency, reporting latency percentiles, time to first byte and throughput.
+Questions are the example questions of the nine tools in tools.py; run the API
+against llm_stub.py to measure it without spending OpenRouter tokens.
+
+Usage:
+    export OPENROUTER_API_KEY=stub
+    python llm_stub.py --port 8100 &
+    OPENROUTER_BASE_URL=http://127.0.0.1:8100/v1 uvicorn main:app --port 8000 &
+    python loadtest.py --concurrency 1,4,16,64 --requests 200
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+import numpy as np
+from tools import tools
+
+
+# (function name, question) pairs from the example questions of every tool
+def question_mix(function_names=None) -> list:
+    mix = []
+    for tool in tools:
+        function = tool["function"]
+        if function_names and function["name"] not in function_names:
+            continue
+        _, _, examples = function["description"].partition("questions:")
+        mix.extend(
+            (function["name"], example.strip())
+            for example in examples.split(",")
+            if example.strip()
+        )
+    return mix
+
+
+# Customer IDs to ask about, from the customer_data dataset
+def sample_customer_ids(n: int, seed: int) -> list:
+    from data import datasets
+
+    customer_ids = datasets["customer_data"]["BP Number WM Core"].dropna()
+    return [
+        str(int(i))
+        for i in customer_ids.sample(min(n, len(customer_ids)), random_state=seed)
+    ]
+
+
+# Send one chat and read the streamed answer to the end
+async def chat_once(client: httpx.AsyncClient, url: str, payload: dict) -> dict:
+    start = time.perf_counter()
+    ttfb, nbytes, status = None, 0, None
+    try:
+        async with client.stream("POST", url, json=payload) as response:
+            status = response.status_code
+            async for data in response.aiter_bytes():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                nbytes += len(data)
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return {
+        "ok": status == 200 and nbytes > 0,
+        "status": status,
+        "seconds": time.perf_counter() - start,
+        "ttfb": ttfb,
+        "bytes": nbytes,
+    }
+
+
+# Run `requests` chats with `concurrency` workers, each sending its next chat
+# as soon as the previous one finishes
+async def run_level(args, concurrency: int, mix: list, customer_ids: list) -> tuple:
+    rng = random.Random(args.seed + concurrency)
+    remaining = iter(range(args.requests))
+    results = []
+
+    async def worker(client):
+        for n in remaining:
+            function_name, question = rng.choice(mix)
+            if args.vary:
+                # Defeat the tool-selection cache: every question is new
+                question = f"{question} (request {concurrency}-{n})"
+            payload = {
+                "query": question,
+                "language": rng.choice(args.languages),
+                "customer_id": rng.choice(customer_ids),
+            }
+            result = await chat_once(client, args.url, payload)
+            result["function_name"] = function_name
+            results.append(result)
+
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        seconds = time.perf_counter() - start
+    return results, seconds
+
+
+def percentiles(values, qs=(50, 95, 99)) -> list:
+    if not values:
+        return [float("nan")] * len(qs)
+    return list(np.percentile(values, qs))
+
+
+def report(concurrency: int, results: list, seconds: float, by_function: bool):
+    ok = [r for r in results if r["ok"]]
+    p50, p95, p99 = percentiles([r["seconds"] for r in ok])
+    ttfb50, ttfb95, _ = percentiles([r["ttfb"] for r in ok])
+    print(
+        f"{concurrency:>6}{len(results):>8}{len(results) - len(ok):>7}"
+        f"{len(ok) / seconds:>8.2f}{p50:>8.2f}{p95:>8.2f}{p99:>8.2f}"
+        f"{ttfb50:>8.2f}{ttfb95:>8.2f}"
+    )
+    if by_function:
+        for function_name in sorted({r["function_name"] for r in results}):
+            runs = [r for r in results if r["function_name"] == function_name]
+            done = [r for r in runs if r["ok"]]
+            f50, f95, _ = percentiles([r["seconds"] for r in done])
+            t50, _, _ = percentiles([r["ttfb"] for r in done])
+            print(
+                f"{'':>6}  {function_name:<42}{len(runs):>5} runs"
+                f"{len(runs) - len(done):>4} err  p50 {f50:.2f}  p95 {f95:.2f}"
+                f"  ttfb p50 {t50:.2f}"
+            )
+
+
+async def main(args):
+    mix = question_mix(args.functions)
+    customer_ids = args.customer_ids or sample_customer_ids(args.customers, args.seed)
+    print(f"{len(mix)} questions, {len(customer_ids)} customers, {args.url}")
+    print(
+        f"{'conc':>6}{'reqs':>8}{'errors':>7}{'rps':>8}{'p50':>8}{'p95':>8}{'p99':>8}"
+        f"{'ttfb50':>8}{'ttfb95':>8}  (seconds)"
+    )
+    for concurrency in args.concurrency:
+        results, seconds = await run_level(args, concurrency, mix, customer_ids)
+        report(concurrency, results, seconds, args.by_function)
+        errors = {r["status"] for r in results if not r["ok"]}
+        if errors:
+            print(f"{'':>6}  errors: {', '.join(map(str, sorted(errors, key=str)))}")
+
+
+def comma_list(value: str) -> list:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000/api_chat")
+    parser.add_argument(
+        "--concurrency",
+        type=lambda v: [int(c) for c in comma_list(v)],
+        default=[1, 4, 16, 64],
+        help="comma-separated concurrency levels, run in order",
+    )
+    parser.add_argument("--requests", type=int, default=200, help="chats per level")
+    parser.add_argument(
+        "--functions",
+        type=comma_list,
+        help="only ask questions for these tools, e.g. present_customer_profile",
+    )
+    parser.add_argument(
+        "--customer-ids", type=comma_list, help="default: sampled from customer_data"
+    )
+    parser.add_argument("--customers", type=int, default=100)
+    parser.add_argument(
+        "--languages", type=comma_list, default=["English", "Indonesian"]
+    )
+    parser.add_argument(
+        "--vary",
+        action="store_true",
+        help="make every question unique, so the tool-selection cache never hits",
+    )
+    parser.add_argument("--by-function", action="store_true")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -1,14 +1,22 @@
+import asyncio
 import json
 import logging
+import time
 
 import pandas as pd
-import psycopg2
+from cache import LRUCache, canonicalize_sql, fingerprint, normalize_text
+from db import close_db_pool, db_pool, fetch_bounded_dataframe, open_db_pool
 from functions import *
+from metrics import *
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from psycopg.errors import QueryCanceled, ReadOnlySqlTransaction
 from setup import *
+from sql_cache import SQLCache
+from structured import StructuredOutputError, hedge_stats, hedged_call
 from tools import *
 
 from fastapi import HTTPException
-from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 
 ######################################################## Logger Configuration
 # Configure logging
@@ -46,9 +54,100 @@ table_schemas_map = {
     "table_schemas_product_data": table_schemas_product_data,
     "table_schemas_customer_transaction": table_schemas_customer_transaction,
 }
+
+# Cache of tool-selection results: (tools fingerprint, normalized query) -> function name.
+# Keying on the tools fingerprint invalidates every entry when the tool definitions change.
+tools_fingerprint = fingerprint(tools)
+tool_selection_cache = LRUCache(maxsize=TOOL_CACHE_SIZE, ttl=TOOL_CACHE_TTL)
+# Generated SQL is only reused while the table schema it was written for is unchanged
+sql_schema_fingerprints = {
+    "generate_sql_syntax_product_data": fingerprint(table_schemas_product_data),
+    "generate_sql_syntax_customer_transaction": fingerprint(
+        table_schemas_customer_transaction
+    ),
+}
+sql_cache = SQLCache(maxsize=SQL_CACHE_SIZE)
+# Results of generated SQL, by data version and canonical SQL. The data version
+# advances when this process reloads data; the TTL bounds staleness otherwise.
+sql_result_cache = LRUCache(
+    maxsize=SQL_RESULT_CACHE_SIZE,
+    ttl=SQL_RESULT_CACHE_TTL,
+    maxbytes=SQL_RESULT_CACHE_MAX_BYTES,
+    sizeof=lambda result: int(result[0].memory_usage(deep=True).sum()),
+)
+_cache_miss = object()
+
+
+# Hit/miss statistics of every cache, for /health and /metrics
+def cache_stats() -> dict:
+    return {
+        "tool_selection": tool_selection_cache.stats(),
+        "prompt": prompt_cache.stats(),
+        "sql": sql_cache.stats(),
+        "sql_result": sql_result_cache.stats(),
+    }
+
+
+REGISTRY.register(StatsCollector(cache_stats, hedge_stats.stats, db_pool.get_stats))
 ######################################################## End of Initialization
 
 
+######################################################## Lifecycle
+# Tasks running for the lifetime of the app, cancelled on shutdown
+background_tasks = set()
+
+
+# Poll for new ingestions; the data version changes with them, so cached SQL
+# results and prompts from before are never served, and the catalog is reloaded
+async def watch_data_version():
+    while True:
+        await asyncio.sleep(DATA_VERSION_CHECK_SECONDS)
+        if await refresh_ingestion_version():
+            try:
+                await ensure_product_resolver(reload=True)
+            except Exception as e:
+                logger.warning(f"Product catalog not reloaded: {e}")
+
+
+# Write the last use of served SQL cache entries, which load() keeps on restart
+async def flush_sql_cache_usage():
+    while True:
+        await asyncio.sleep(SQL_CACHE_USAGE_FLUSH_SECONDS)
+        await sql_cache.flush_usage()
+
+
+@app.on_event("startup")
+async def startup():
+    # Load the datasets listed in DATA_WARM_DATASETS; the rest load on first access
+    datasets.warm(DATA_WARM_DATASETS)
+    # Open the shared PostgreSQL connection pool
+    await open_db_pool()
+    # Warm the in-memory product catalog; it is retried lazily on first use
+    try:
+        await ensure_product_resolver()
+    except Exception as e:
+        logger.warning(f"Product catalog not loaded at startup: {e}")
+    # Track ingestions by init-db.py, which change the data version cache keys use
+    await refresh_ingestion_version()
+    background_tasks.add(asyncio.ensure_future(watch_data_version()))
+    background_tasks.add(asyncio.ensure_future(flush_sql_cache_usage()))
+    # Reload generated SQL cached by previous runs
+    try:
+        await sql_cache.load()
+    except Exception as e:
+        logger.warning(f"SQL cache not loaded at startup: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await sql_cache.flush_usage()
+    # Release the shared OpenRouter and PostgreSQL connection pools
+    await client.close()
+    await close_db_pool()
+
+
 ######################################################## Health Check endpoint
 @app.get("/")
 async def root():
@@ -59,11 +158,194 @@ async def root():
 @app.get("/health")
 async def health_check():
     logger.info("Health check endpoint accessed")
-    return {"status": "healthy", "database": "postgresql"}
+    return {
+        "status": "healthy",
+        "database": "postgresql",
+        "caches": cache_stats(),
+        "datasets": datasets.stats(),
+        "structured_output": hedge_stats.stats(),
+    }
+
+
+######################################################## Metrics endpoint
+# Prometheus text exposition of this worker's metrics (see metrics.py)
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+######################################################## Customer context prefetch
+# Builders that are safe to start speculatively: they only take (customer_id,
+# language), read data without calling the LLM and are memoized by cache_prompt
+prefetchable_functions = {
+    "present_customer_profile",
+    "present_optimized_portfolio",
+    "present_historical_transaction",
+    "present_recommended_products",
+}
+unknown_prefetch_functions = set(PREFETCH_FUNCTIONS) - prefetchable_functions
+if unknown_prefetch_functions:
+    raise ValueError(
+        "PREFETCH_FUNCTIONS has functions that can't be prefetched: "
+        f"{', '.join(sorted(unknown_prefetch_functions))} "
+        f"(allowed: {', '.join(sorted(prefetchable_functions))})"
+    )
+
+# Limits the worker threads held by speculative builds; created on first use so
+# it binds to the server's event loop
+_prefetch_threads = None
+
+
+# Build a customer prompt off the event loop; builders are memoized by cache_prompt
+async def build_customer_prompt(function_name: str, customer_id: int, language: str):
+    global _prefetch_threads
+    builder = function_map[function_name]
+    if asyncio.iscoroutinefunction(builder):
+        return await builder(customer_id, language)
+    if _prefetch_threads is None:
+        _prefetch_threads = asyncio.Semaphore(PREFETCH_MAX_THREADS)
+    # A running thread can't be cancelled, but a build still waiting here can
+    async with _prefetch_threads:
+        return await asyncio.to_thread(builder, customer_id, language)
+
+
+# Start the PREFETCH_FUNCTIONS prompts for a customer, to overlap with tool routing
+def start_prefetch(customer_id: str, language: str) -> dict:
+    if not customer_id or not customer_id.isdigit():
+        return {}
+    prefetch = {}
+    for function_name in PREFETCH_FUNCTIONS:
+        task = asyncio.ensure_future(
+            build_customer_prompt(function_name, int(customer_id), language)
+        )
+        # Errors surface when the chosen branch awaits its task; don't log the others
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        prefetch[function_name] = task
+    return prefetch
+
+
+# Cancel the prefetched prompts that won't be used
+def cancel_prefetch(prefetch: dict, keep: Optional[str] = None):
+    for function_name, task in prefetch.items():
+        if function_name != keep:
+            task.cancel()
+
+
+######################################################## Structured output
+# Structured output (parse) and JSON mode are hedged: see structured.hedged_call
+json_allocation_instruction = 'IMPORTANT: Respond with ONLY a valid JSON object in this exact format: {"RD_allocation": 0.0, "SB_allocation": 0.0}'
+json_sql_instruction = 'IMPORTANT: Respond with ONLY a valid JSON object in this exact format: {"sql_syntax": "YOUR_SQL_QUERY_HERE"}'
+
+
+# Read the RD/SB allocation for a reallocation request with the SQL model
+async def generate_allocation(prompt: str) -> Allocation:
+    async def structured():
+        response = await client.beta.chat.completions.parse(
+            model="Qwen/Qwen3-Coder-480B-A35B-Instruct-Turbo",
+            messages=[{"role": "user", "content": prompt}],
+            response_format=Allocation,
+        )
+        allocation = response.choices[0].message.parsed
+        if allocation is None:
+            raise ValueError("no parsed allocation in the response")
+        return allocation
+
+    async def json_mode():
+        response = await client.chat.completions.create(
+            model="Qwen/Qwen3-Coder-480B-A35B-Instruct-Turbo",
+            messages=[
+                {
+                    "role": "user",
+                    "content": f"{prompt}\n\n{json_allocation_instruction}",
+                }
+            ],
+            response_format={"type": "json_object"},
+        )
+        response_content = response.choices[0].message.content
+        logger.info(f"Raw allocation response: {response_content}")
+        response_json = json.loads(response_content)
+        return Allocation(
+            RD_allocation=float(response_json.get("RD_allocation", 0.0)),
+            SB_allocation=float(response_json.get("SB_allocation", 0.0)),
+        )
+
+    logger.info("Calling OpenRouter API for allocation parsing")
+    try:
+        with stage_timer("structured_output", "get_new_allocation"):
+            allocation, strategy = await hedged_call(
+                "get_new_allocation", structured, json_mode, STRUCTURED_HEDGE_DELAY
+            )
+    except StructuredOutputError as e:
+        logger.error(f"Failed to parse allocation: {e}")
+        logger.warning("Using default allocation values due to parsing error")
+        return Allocation(RD_allocation=0.0, SB_allocation=0.0)
+    logger.info(
+        f"Allocation received ({strategy}) - RD: {allocation.RD_allocation}, SB: {allocation.SB_allocation}"
+    )
+    return allocation
+
+
+# Generate SQL for a question with the SQL model
+async def generate_sql_syntax(function_name: str, question: str) -> str:
+    logger.info(f"Generating SQL syntax using function: {function_name}")
+    sql_generation_prompt = function_map[function_name](question)
+
+    async def structured():
+        response = await client.beta.chat.completions.parse(
+            model="Qwen/Qwen3-Coder-480B-A35B-Instruct-Turbo",
+            messages=[{"role": "system", "content": sql_generation_prompt}],
+            temperature=0.7,
+            response_format=SQLresponse,
+        )
+        return response.choices[0].message.parsed.sql_syntax
+
+    async def json_mode():
+        response = await client.chat.completions.create(
+            model="Qwen/Qwen3-Coder-480B-A35B-Instruct-Turbo",
+            messages=[
+                {
+                    "role": "system",
+                    "content": f"{sql_generation_prompt}\n\n{json_sql_instruction}",
+                }
+            ],
+            temperature=0.7,
+            response_format={"type": "json_object"},
+        )
+        response_content = response.choices[0].message.content.strip()
+        logger.info(f"Raw response: {response_content}")
+        try:
+            return json.loads(response_content)["sql_syntax"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            # Not the requested JSON, but possibly the bare query
+            if response_content.upper().startswith(("SELECT", "WITH")):
+                return response_content
+            raise ValueError("response is neither the requested JSON nor SQL")
+
+    # Generate SQL query using OpenRouter
+    logger.info("Calling OpenRouter API for SQL generation")
+    with stage_timer("structured_output", function_name):
+        sql_syntax, strategy = await hedged_call(
+            function_name, structured, json_mode, STRUCTURED_HEDGE_DELAY
+        )
+    logger.info(f"Generated SQL query ({strategy}): {sql_syntax}")
+    return sql_syntax
+
+
+# Run generated SQL, reusing the result of the same query while it is cached
+async def fetch_sql_results(sql_syntax: str) -> tuple:
+    key = (current_data_version(), canonicalize_sql(sql_syntax))
+    result = sql_result_cache.get(key)
+    if result is not None:
+        logger.info("SQL result cache hit")
+        return result
+    result = await fetch_bounded_dataframe(sql_syntax)
+    sql_result_cache.set(key, result)
+    return result
 
 
 ######################################################## Chat API endpoint
 @app.post("/api_chat")
+@track_in_flight(CHAT_IN_FLIGHT)
 async def api_chat(request: ChatRequest):
     logger.info(
         f"API chat request received - Query: {request.query[:100]}..., Language: {request.language}, Customer ID: {request.customer_id}"
@@ -80,220 +362,188 @@ async def api_chat(request: ChatRequest):
     )
     messages = default_messages + messages
 
-    # Call OpenRouter API
-    logger.info("Calling OpenRouter API for tool selection")
-    try:
-        response_tool_call = client.chat.completions.create(
-            model="openai/gpt-oss-120b",
-            messages=messages,
-            tools=tools,  # Use function calling
-            temperature=0.3,
-        )
-        logger.info("OpenRouter API tool call response received")
-    except Exception as e:
-        logger.error(f"Error calling OpenRouter API for tool selection: {e}")
-        raise
-
-    # Extract tool calls (function calling)
-    tool_calls = response_tool_call.choices[0].message.tool_calls
+    # Reuse a previous tool selection for the same question if available
+    tool_cache_key = (tools_fingerprint, normalize_text(request.query))
+    function_name = tool_selection_cache.get(tool_cache_key, _cache_miss)
+    prefetch = {}
+    if function_name is not _cache_miss:
+        logger.info(f"Tool selection cache hit - Function: {function_name}")
+    else:
+        # Build the likely customer prompts while the routing call is in flight
+        prefetch = start_prefetch(request.customer_id, request.language)
 
-    if tool_calls is not None:
-        tool_call = tool_calls[0]
-        function_name = tool_call.function.name
+        # Call OpenRouter API
+        with stage_timer("tool_selection") as routing:
+            logger.info("Calling OpenRouter API for tool selection")
+            try:
+                response_tool_call = await client.chat.completions.create(
+                    model="openai/gpt-oss-120b",
+                    messages=messages,
+                    tools=tools,  # Use function calling
+                    temperature=0.3,
+                )
+                logger.info("OpenRouter API tool call response received")
+            except Exception as e:
+                logger.error(f"Error calling OpenRouter API for tool selection: {e}")
+                cancel_prefetch(prefetch)
+                raise
 
+            # Extract tool calls (function calling)
+            tool_calls = response_tool_call.choices[0].message.tool_calls
+            function_name = tool_calls[0].function.name if tool_calls else None
+            routing.function_name = function_name
+        # A no-tool answer may be transient, so it isn't pinned for the whole TTL
+        if function_name is not None:
+            tool_selection_cache.set(tool_cache_key, function_name)
+        # Keep only the prompt the chosen branch will use
+        cancel_prefetch(prefetch, keep=function_name)
+
+    CHAT_REQUESTS.labels(function_name or "none").inc()
+    if function_name is not None:
         logger.info(f"Tool call detected - Function: {function_name}")
 
-        # For function that requires customer_id
-        if function_name in list_functions_id_required:
-            customer_id = request.customer_id
-            if customer_id is not None:
-                logger.info(
-                    f"Executing function '{function_name}' for customer_id: {customer_id}"
-                )
-                if function_name == "get_new_allocation":
-                    logger.info("Getting new allocation for customer")
-                    prompt, current_asset = get_new_allocation(
-                        int(customer_id), request.query
+        # Prompt building; SQL generation and the query are timed as their own stages
+        with stage_timer("data_function", function_name):
+            # For function that requires customer_id
+            if function_name in list_functions_id_required:
+                customer_id = request.customer_id
+                if customer_id is not None:
+                    logger.info(
+                        f"Executing function '{function_name}' for customer_id: {customer_id}"
                     )
-                    msg = [{"role": "user", "content": prompt}]
-                    logger.info("Calling OpenRouter API for allocation parsing")
-                    try:
-                        # Try structured output first
-                        response_reallocation = client.beta.chat.completions.parse(
-                            model="Qwen/Qwen3-Coder-480B-A35B-Instruct-Turbo",
-                            messages=msg,
-                            response_format=Allocation,
+                    if function_name == "get_new_allocation":
+                        logger.info("Getting new allocation for customer")
+                        prompt, current_asset = get_new_allocation(
+                            int(customer_id), request.query
                         )
-                        allocation = response_reallocation.choices[0].message.parsed
-                        logger.info(
-                            f"Allocation received (structured) - RD: {allocation.RD_allocation}, SB: {allocation.SB_allocation}"
+                        allocation = await generate_allocation(prompt)
+                        prompt = present_new_portfolio(
+                            int(customer_id),
+                            request.language,
+                            current_asset,
+                            allocation.RD_allocation,
+                            allocation.SB_allocation,
                         )
-                    except Exception as parse_error:
-                        logger.warning(
-                            f"Structured output failed: {parse_error}, trying JSON mode fallback"
+                    elif function_name in prefetch:
+                        logger.info(f"Using prefetched prompt: {function_name}")
+                        prompt = await prefetch[function_name]
+                    elif function_name == "present_recommended_products":
+                        logger.info("Getting recommended products")
+                        prompt = await present_recommended_products(
+                            int(customer_id), request.language
                         )
-                        # Fallback: Use JSON mode with explicit prompt
-                        json_prompt = f'{prompt}\n\nIMPORTANT: Respond with ONLY a valid JSON object in this exact format: {{"RD_allocation": 0.0, "SB_allocation": 0.0}}'
-                        response_reallocation = client.chat.completions.create(
-                            model="Qwen/Qwen3-Coder-480B-A35B-Instruct-Turbo",
-                            messages=[{"role": "user", "content": json_prompt}],
-                            response_format={"type": "json_object"},
+                    elif function_name == "previous_period_performance":
+                        logger.info("Getting previous period performance")
+                        prompt = function_map[function_name](
+                            int(customer_id), request.language, request.query
                         )
-                        response_content = response_reallocation.choices[
-                            0
-                        ].message.content
-                        logger.info(f"Raw allocation response: {response_content}")
-
-                        # Parse JSON response
-                        try:
-                            response_json = json.loads(response_content)
-                            allocation = Allocation(
-                                RD_allocation=float(
-                                    response_json.get("RD_allocation", 0.0)
-                                ),
-                                SB_allocation=float(
-                                    response_json.get("SB_allocation", 0.0)
-                                ),
-                            )
-                            logger.info(
-                                f"Allocation received (fallback) - RD: {allocation.RD_allocation}, SB: {allocation.SB_allocation}"
-                            )
-                        except (json.JSONDecodeError, ValueError, KeyError) as e:
-                            logger.error(f"Failed to parse allocation JSON: {e}")
-                            # Default allocation if parsing fails
-                            allocation = Allocation(
-                                RD_allocation=0.0, SB_allocation=0.0
-                            )
-                            logger.warning(
-                                "Using default allocation values due to parsing error"
-                            )
-                    prompt = present_new_portfolio(
-                        int(customer_id),
-                        request.language,
-                        current_asset,
-                        allocation.RD_allocation,
-                        allocation.SB_allocation,
-                    )
-                elif function_name == "previous_period_performance":
-                    logger.info("Getting previous period performance")
-                    prompt = function_map[function_name](
-                        int(customer_id), request.language, request.query
-                    )
+                    else:
+                        logger.info(f"Executing function: {function_name}")
+                        prompt = function_map[function_name](
+                            int(customer_id), request.language
+                        )
+                    # Append prompt to messages
+                    messages.append({"role": "user", "content": prompt})
+                    logger.info(f"Function '{function_name}' executed successfully")
                 else:
-                    logger.info(f"Executing function: {function_name}")
-                    prompt = function_map[function_name](
-                        int(customer_id), request.language
-                    )
-                # Append prompt to messages
-                messages.append({"role": "user", "content": prompt})
-                logger.info(f"Function '{function_name}' executed successfully")
-            else:
-                logger.warning("Function requires customer_id but none provided")
-                return PlainTextResponse("Tolong masukkan ID nasabah.")
-
-        # For function that requires SQL syntax
-        elif function_name in [
-            "generate_sql_syntax_product_data",
-            "generate_sql_syntax_customer_transaction",
-        ]:
-            logger.info(f"Generating SQL syntax using function: {function_name}")
-            sql_generation_prompt = function_map[function_name](request.query)
-
-            # Generate SQL query using OpenRouter
-            logger.info("Calling OpenRouter API for SQL generation")
-            try:
-                # Try structured output first
-                query_response = client.beta.chat.completions.parse(
-                    model="Qwen/Qwen3-Coder-480B-A35B-Instruct-Turbo",
-                    messages=[{"role": "system", "content": sql_generation_prompt}],
-                    temperature=0.7,
-                    response_format=SQLresponse,
+                    logger.warning("Function requires customer_id but none provided")
+                    return PlainTextResponse("Tolong masukkan ID nasabah.")
+
+            # For function that requires SQL syntax
+            elif function_name in [
+                "generate_sql_syntax_product_data",
+                "generate_sql_syntax_customer_transaction",
+            ]:
+                sql_cache_key = sql_cache.key(
+                    function_name, sql_schema_fingerprints[function_name], request.query
                 )
-                # Extract the SQL syntax from the response
-                sql_syntax = query_response.choices[0].message.parsed.sql_syntax
-                logger.info(f"Generated SQL query (structured): {sql_syntax}")
-            except Exception as parse_error:
-                logger.warning(
-                    f"Structured output failed: {parse_error}, trying JSON mode fallback"
-                )
-                # Fallback: Use JSON mode with explicit prompt
-                json_prompt = f'{sql_generation_prompt}\n\nIMPORTANT: Respond with ONLY a valid JSON object in this exact format: {{"sql_syntax": "YOUR_SQL_QUERY_HERE"}}'
-                query_response = client.chat.completions.create(
-                    model="Qwen/Qwen3-Coder-480B-A35B-Instruct-Turbo",
-                    messages=[{"role": "system", "content": json_prompt}],
-                    temperature=0.7,
-                    response_format={"type": "json_object"},
-                )
-                response_content = query_response.choices[0].message.content
-                logger.info(f"Raw response: {response_content}")
+                sql_syntax = await sql_cache.get(sql_cache_key)
+                sql_cache_hit = sql_syntax is not None
+                if sql_cache_hit:
+                    logger.info(f"SQL cache hit: {sql_syntax}")
+                else:
+                    sql_syntax = await generate_sql_syntax(function_name, request.query)
 
-                # Try to parse as JSON
+                # Execute generated query: read-only, time-limited, row- and byte-capped
+                logger.info("Executing SQL query on pooled connection")
                 try:
-                    response_json = json.loads(response_content)
-                    sql_syntax = response_json.get("sql_syntax", response_content)
-                except json.JSONDecodeError:
-                    # If it's not JSON, check if it's just the SQL query
-                    if response_content.strip().upper().startswith("SELECT"):
-                        sql_syntax = response_content.strip()
-                    else:
-                        # Last resort: try to extract SQL from the response
-                        logger.warning(
-                            "Could not parse JSON, using raw response as SQL"
+                    with stage_timer("db_query", function_name):
+                        results, truncation = await fetch_sql_results(sql_syntax)
+                    logger.info(
+                        f"SQL query executed successfully - Rows returned: {len(results)}"
+                        + (
+                            f" (truncated by {truncation['limit']})"
+                            if truncation["truncated"]
+                            else ""
                         )
-                        sql_syntax = response_content.strip()
-
-                logger.info(f"Generated SQL query (fallback): {sql_syntax}")
-
-            # Execute generated query
-            logger.info("Connecting to database and executing SQL query")
-            try:
-                conn = psycopg2.connect(DATABASE_URL)
-                results = pd.read_sql_query(sql_syntax, conn)
-                conn.close()
-                logger.info(
-                    f"SQL query executed successfully - Rows returned: {len(results)}"
-                )
+                    )
 
-                if not results.empty:
-                    prompt = present_sql_results(results, request.language)
-                else:
-                    logger.warning(f"No results found for SQL query: {sql_syntax}")
-                    prompt = f"No results found for query: {sql_syntax}. Explain possible failure of the query."
+                    if not results.empty:
+                        prompt = present_sql_results(
+                            results, request.language, truncation
+                        )
+                        # Only SQL that ran and found rows is worth reusing
+                        if not sql_cache_hit:
+                            await sql_cache.store(sql_cache_key, sql_syntax)
+                    else:
+                        logger.warning(f"No results found for SQL query: {sql_syntax}")
+                        # Cached SQL that stopped finding rows is stale
+                        if sql_cache_hit:
+                            await sql_cache.discard(sql_cache_key)
+                        prompt = f"No results found for query: {sql_syntax}. Explain possible failure of the query."
+                    messages.append({"role": "user", "content": prompt})
+                except (QueryCanceled, ReadOnlySqlTransaction) as db_error:
+                    # Runaway or writing query: tell the user instead of failing the request
+                    logger.warning(f"Generated SQL query rejected: {db_error}")
+                    await sql_cache.discard(sql_cache_key)
+                    prompt = f"The query {sql_syntax} was stopped ({db_error}). Answer in {request.language}: explain that the question needs a narrower, read-only query and suggest how to rephrase it."
+                    messages.append({"role": "user", "content": prompt})
+                except Exception as db_error:
+                    logger.error(f"Database error executing SQL query: {db_error}")
+                    await sql_cache.discard(sql_cache_key)
+                    raise
+
+            elif function_name == "filter_customers_region":
+                logger.info("Filtering customers by region")
+                prompt = function_map[function_name](request.query, request.language)
                 messages.append({"role": "user", "content": prompt})
-            except Exception as db_error:
-                logger.error(f"Database error executing SQL query: {db_error}")
-                raise
-
-        elif function_name == "filter_customers_region":
-            logger.info("Filtering customers by region")
-            prompt = function_map[function_name](request.query, request.language)
-            messages.append({"role": "user", "content": prompt})
     else:
         logger.info("No tool calls detected, proceeding with direct chat response")
 
     try:
         logger.info("Starting streaming response generation")
 
-        def data_generator():
+        async def data_generator():
             # Call the OpenRouter API
             logger.info("Calling OpenRouter API for streaming chat response")
+            stream_label = function_name or "none"
+            STREAMS_IN_FLIGHT.inc()
+            start = time.perf_counter()
             try:
-                response = client.chat.completions.create(
+                response = await client.chat.completions.create(
                     model="openai/gpt-oss-120b",
                     messages=messages,
                     temperature=1,
                     stream=True,
                 )
                 chunk_count = 0
-                for chunk in response:
+                async for chunk in response:
                     content = chunk.choices[0].delta.content
                     if content:
+                        if not chunk_count:
+                            TIME_TO_FIRST_TOKEN.labels(stream_label).observe(
+                                time.perf_counter() - start
+                            )
                         chunk_count += 1
                         yield content
                 logger.info(f"Streaming completed - Total chunks: {chunk_count}")
+                STREAM_CHUNKS.labels(stream_label).observe(chunk_count)
             except Exception as stream_error:
                 logger.error(f"Error during streaming: {stream_error}")
                 raise
+            finally:
+                STREAMS_IN_FLIGHT.dec()
+                STREAM_SECONDS.labels(stream_label).observe(time.perf_counter() - start)
 
             # # For SQL-related functions, append the query results at the end
             # if function_name in ['generate_sql_syntax_product_data', 'generate_sql_syntax_customer_transaction']:
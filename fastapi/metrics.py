@@ -0,0 +1,196 @@
+import contextvars
+import functools
+import time
+from typing import Callable, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from fastapi.responses import StreamingResponse
+
+# Latency buckets in seconds, from in-memory lookups up to long LLM calls
+latency_buckets = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120
+)  # fmt: skip
+
+# Stages of a chat request: tool_selection, data_function (building the prompt
+# from data), structured_output (hedged allocation/SQL calls) and db_query
+STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Time spent in each stage of /api_chat, excluding nested stages",
+    ["stage", "function_name"],
+    buckets=latency_buckets,
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "chat_time_to_first_token_seconds",
+    "Time from the streaming LLM request to its first content chunk",
+    ["function_name"],
+    buckets=latency_buckets,
+)
+STREAM_SECONDS = Histogram(
+    "chat_stream_seconds",
+    "Duration of the streamed LLM answer",
+    ["function_name"],
+    buckets=latency_buckets,
+)
+STREAM_CHUNKS = Histogram(
+    "chat_stream_chunks",
+    "Content chunks per streamed answer",
+    ["function_name"],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+CHAT_REQUESTS = Counter(
+    "chat_requests", "Chat requests by selected function", ["function_name"]
+)
+CHAT_IN_FLIGHT = Gauge(
+    "chat_requests_in_flight", "Chat requests being processed or streamed"
+)
+STREAMS_IN_FLIGHT = Gauge("chat_streams_in_flight", "LLM answers being streamed")
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds",
+    "PostgreSQL query time, including fetching the rows",
+    ["query"],
+    buckets=latency_buckets,
+)
+DB_QUERY_ROWS = Histogram(
+    "db_query_rows",
+    "Rows returned per PostgreSQL query",
+    ["query"],
+    buckets=(0, 1, 10, 50, 100, 200, 500, 1000, 10000, 100000, 1000000),
+)
+
+# Innermost stage timer of the running task
+_current_stage = contextvars.ContextVar("current_stage", default=None)
+
+
+class stage_timer:
+    """
+    Context manager observing the duration of a chat stage into STAGE_SECONDS.
+    Time spent in a stage timed inside it is attributed to the inner stage
+    only, so the stages of one request add up to its duration before streaming.
+    function_name may be set inside the block, once the tool is known.
+    """
+
+    def __init__(self, stage: str, function_name: Optional[str] = None):
+        self.stage = stage
+        self.function_name = function_name
+        self.nested = 0.0
+
+    def __enter__(self):
+        self._token = _current_stage.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        _current_stage.reset(self._token)
+        parent = _current_stage.get()
+        if parent is not None:
+            parent.nested += elapsed
+        STAGE_SECONDS.labels(self.stage, self.function_name or "none").observe(
+            elapsed - self.nested
+        )
+
+
+# Record the time and row count of a PostgreSQL query
+def observe_db_query(query: str, seconds: float, rows: int):
+    DB_QUERY_SECONDS.labels(query).observe(seconds)
+    DB_QUERY_ROWS.labels(query).observe(rows)
+
+
+# Scrape-time view of counters the app already keeps, so lookups pay nothing extra
+class StatsCollector:
+    """
+    Exposes cache hits/misses and hit ratios, structured-output hedge results and
+    connection pool usage. The values are read from the caches' and pools' own
+    statistics when /metrics is scraped, not updated on the request path.
+
+    Parameters:
+    cache_stats (Callable): Returns {cache name: LRUCache.stats()}
+    hedge_stats (Callable): Returns HedgeStats.stats()
+    pool_stats (Callable): Returns the PostgreSQL pool's get_stats()
+    """
+
+    def __init__(
+        self,
+        cache_stats: Callable[[], dict],
+        hedge_stats: Callable[[], dict],
+        pool_stats: Callable[[], dict],
+    ):
+        self.cache_stats = cache_stats
+        self.hedge_stats = hedge_stats
+        self.pool_stats = pool_stats
+
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"])
+        hit_ratio = GaugeMetricFamily(
+            "cache_hit_ratio", "Cache hits per lookup", labels=["cache"]
+        )
+        entries = GaugeMetricFamily("cache_entries", "Cached entries", labels=["cache"])
+        for cache, stats in self.cache_stats().items():
+            hits.add_metric([cache], stats["hits"])
+            misses.add_metric([cache], stats["misses"])
+            hit_ratio.add_metric([cache], stats["hit_ratio"])
+            entries.add_metric([cache], stats["size"])
+        yield from (hits, misses, hit_ratio, entries)
+
+        wins = CounterMetricFamily(
+            "structured_output_wins",
+            "Structured-output calls answered, by winning strategy",
+            labels=["function_name", "strategy"],
+        )
+        hedges = CounterMetricFamily(
+            "structured_output_hedges",
+            "Structured-output calls that sent the JSON-mode hedge",
+            labels=["function_name"],
+        )
+        for path, stats in self.hedge_stats().items():
+            for strategy, count in stats["wins"].items():
+                wins.add_metric([path, strategy], count)
+            hedges.add_metric([path], stats["hedged"])
+        yield from (wins, hedges)
+
+        pool = self.pool_stats()
+        connections = GaugeMetricFamily(
+            "db_pool_connections", "PostgreSQL pool connections", labels=["state"]
+        )
+        connections.add_metric(["open"], pool.get("pool_size", 0))
+        connections.add_metric(["idle"], pool.get("pool_available", 0))
+        yield connections
+        yield GaugeMetricFamily(
+            "db_pool_requests_waiting",
+            "Requests waiting for a pooled connection",
+            value=pool.get("requests_waiting", 0),
+        )
+
+
+# Keep a gauge raised while an endpoint runs and, for a streamed response, until
+# the last chunk is sent
+def track_in_flight(gauge: Gauge):
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            gauge.inc()
+            try:
+                response = await endpoint(*args, **kwargs)
+            except BaseException:
+                gauge.dec()
+                raise
+            if isinstance(response, StreamingResponse):
+                response.body_iterator = _release_after(response.body_iterator, gauge)
+            else:
+                gauge.dec()
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+async def _release_after(body_iterator, gauge: Gauge):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        gauge.dec()
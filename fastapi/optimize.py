@@ -1,16 +1,154 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import pandas as pd
+from scipy.interpolate import RegularGridInterpolator
 from scipy.optimize import minimize
 
+# Asset universe of the optimizer
+assets = ["Deposito", "SB", "RD"]
+
+# Fee based income rates on the allocated amount: [Deposito, SB, RD], as in functions.py
+fee_rates = np.array([0.0, 0.00633, 0.011])
+
+# Asset types of the FUM the optimizer doesn't reallocate, with their master data column
+held_assets = {"CASA": "usd_cur_casa_allocation", "BAC": "usd_cur_bac_allocation"}
+
+# Row order of asset types per customer in optimized_allocation_usd.csv
+asset_type_order = ["CASA", "Deposito", "BAC", "RD", "SB"]
+
+data_dir = os.path.join(os.path.dirname(__file__), "data")
+
+# Market assumptions used when data/optimizer_config.json doesn't exist
+sample_config = os.path.join(os.path.dirname(__file__), "optimizer_config.sample.json")
+
+
+# Load the market assumptions: expected returns, covariance matrix and risk-free rate
+def load_market_inputs(
+    config_path=None, covariance_path=None, expected_returns=None, risk_free_rate=None
+):
+    """
+    Read the optimizer's market assumptions from a JSON config
+    ({"expected_returns": {"Deposito": ..., "SB": ..., "RD": ...}, "risk_free_rate": ...,
+    "covariance_matrix": [[...], ...] or "covariance_matrix.npy"}), with explicit
+    values taking precedence. A relative covariance path is resolved against the
+    config's directory. There are no built-in defaults: every value must come from
+    the config (see optimizer_config.sample.json) or the arguments.
+
+    Returns:
+    tuple: (expected returns, covariance matrix, risk-free rate), in asset order.
+    """
+    config = {}
+    if config_path is not None:
+        with open(config_path) as f:
+            config = json.load(f)
+
+    if expected_returns is None and "expected_returns" in config:
+        missing = [a for a in assets if a not in config["expected_returns"]]
+        if missing:
+            raise ValueError(
+                f'{config_path}: no expected return for {", ".join(missing)}'
+            )
+        expected_returns = [config["expected_returns"][a] for a in assets]
+    if risk_free_rate is None:
+        risk_free_rate = config.get("risk_free_rate")
+    covariance_matrix = None
+    if covariance_path is None and "covariance_matrix" in config:
+        if isinstance(config["covariance_matrix"], str):
+            covariance_path = os.path.join(
+                os.path.dirname(config_path), config["covariance_matrix"]
+            )
+        else:
+            covariance_matrix = np.asarray(config["covariance_matrix"], dtype=float)
+
+    missing = [
+        name
+        for name, value in [
+            ("expected returns", expected_returns),
+            ("risk-free rate", risk_free_rate),
+            ("covariance matrix", covariance_path or covariance_matrix),
+        ]
+        if value is None
+    ]
+    if missing:
+        raise ValueError(
+            f'Missing market inputs: {", ".join(missing)} (set them in the optimizer config or pass them explicitly)'
+        )
 
-# Load Covariance Matrix
-# covariance_matrix = np.load('data/covariance_matrix.npy')
+    expected_returns = np.asarray(expected_returns, dtype=float)
+    if covariance_path is not None:
+        covariance_matrix = np.load(covariance_path)
+    check_market_inputs(expected_returns, covariance_matrix, float(risk_free_rate))
+    return expected_returns, covariance_matrix, float(risk_free_rate)
 
-# Risk-Free Rate
-risk_free_rate = 0.07
+
+# Reject market assumptions the Sharpe ratio maximization can't use
+def check_market_inputs(expected_returns, covariance_matrix, risk_free_rate):
+    """
+    Raise ValueError for mis-shaped inputs, a covariance matrix that isn't
+    symmetric positive semi-definite, or a risk-free rate no asset beats (the
+    max-Sharpe portfolio is then undefined). Warns about assets that return no
+    more than the risk-free rate, since the optimum leaves them out.
+    """
+    n_assets = len(assets)
+    if expected_returns.shape != (n_assets,):
+        raise ValueError(
+            f'Expected {n_assets} expected returns ({", ".join(assets)}), got {expected_returns.shape}'
+        )
+    if covariance_matrix.shape != (n_assets, n_assets):
+        raise ValueError(
+            f"Expected a {n_assets}x{n_assets} covariance matrix, got {covariance_matrix.shape}"
+        )
+    if (
+        not np.allclose(covariance_matrix, covariance_matrix.T)
+        or np.linalg.eigvalsh(covariance_matrix).min() < -1e-12
+    ):
+        raise ValueError("Covariance matrix is not symmetric positive semi-definite")
+    if risk_free_rate >= expected_returns.max():
+        raise ValueError(
+            f"Risk-free rate {risk_free_rate} is not below any expected return "
+            f"({dict(zip(assets, expected_returns.tolist()))}): the max-Sharpe allocation is undefined"
+        )
+    below = [a for a, r in zip(assets, expected_returns) if r <= risk_free_rate]
+    if below:
+        print(
+            f'Warning: {", ".join(below)} return no more than the risk-free rate {risk_free_rate}; '
+            "the optimizer will allocate little or nothing to them",
+            file=sys.stderr,
+        )
+
+
+# Expected return and fee rate of the held (not reallocated) asset types
+def load_held_asset_rates(config_path) -> dict:
+    """
+    Read {"held_assets": {"CASA": {"expected_return": ..., "fee_rate": ...}, ...}}
+    from the optimizer config. Only needed for customers whose CASA/BAC rows
+    aren't in the previous output file.
+
+    Returns:
+    dict: {asset type: (expected return, fee rate)} for the assets the config has.
+    """
+    with open(config_path) as f:
+        config = json.load(f)
+    return {
+        asset: (float(rates["expected_return"]), float(rates.get("fee_rate", 0.0)))
+        for asset, rates in config.get("held_assets", {}).items()
+    }
 
 
 # Optimize the allocation to maximize the Sharpe ratio
-def optimize_allocation(current_allocation, propensity_scores, expected_returns):
+def optimize_allocation(
+    current_allocation,
+    propensity_scores,
+    expected_returns,
+    covariance_matrix,
+    risk_free_rate,
+):
     """
     Optimize the allocation to maximize the Sharpe ratio.
     Asset orders: [Deposito, SB, RD]
@@ -26,17 +164,20 @@ def optimize_allocation(current_allocation, propensity_scores, expected_returns)
     numpy.ndarray: Optimized allocation of assets.
     """
     adjusted_returns = adjust_expected_returns(propensity_scores, expected_returns)
-    
-    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - 1})  # Sum of weights = 1
-    bounds = tuple((0, 1) for _ in range(len(current_allocation)))  # Weights between 0 and 1
-    
+
+    constraints = {"type": "eq", "fun": lambda x: np.sum(x) - 1}  # Sum of weights = 1
+    bounds = tuple(
+        (0, 1) for _ in range(len(current_allocation))
+    )  # Weights between 0 and 1
+
     result = minimize(
         sharpe_ratio,
-        current_allocation,
+        _warm_start(current_allocation),
         args=(adjusted_returns, covariance_matrix, risk_free_rate),
-        method='SLSQP',
+        method="SLSQP",
+        jac=sharpe_ratio_gradient,
         bounds=bounds,
-        constraints=constraints
+        constraints=constraints,
     )
     return result.x, adjusted_returns
 
@@ -58,13 +199,17 @@ def adjust_expected_returns(propensity_scores, expected_returns, alpha=0.1):
     propensity_scores = np.array(propensity_scores)
     expected_returns = np.array(expected_returns)
     default_propensity = np.ones(len(propensity_scores))
-    adjusted_expected_returns = (default_propensity + alpha * propensity_scores) * expected_returns
+    adjusted_expected_returns = (
+        default_propensity + alpha * propensity_scores
+    ) * expected_returns
 
     return adjusted_expected_returns
 
 
 # Function to maximize the Sharpe ratio for the portfolio
-def sharpe_ratio(current_allocation, expected_returns, covariance_matrix, risk_free_rate):
+def sharpe_ratio(
+    current_allocation, expected_returns, covariance_matrix, risk_free_rate
+):
     """
     Calculate the Sharpe ratio for a given portfolio.
 
@@ -78,5 +223,512 @@ def sharpe_ratio(current_allocation, expected_returns, covariance_matrix, risk_f
     float: The negative Sharpe ratio (for minimization in optimization).
     """
     portfolio_return = np.dot(current_allocation, expected_returns)
-    portfolio_risk = np.sqrt(np.dot(current_allocation.T, np.dot(covariance_matrix, current_allocation)))
-    return -(portfolio_return - risk_free_rate) / portfolio_risk  # Negative for minimization
\ No newline at end of file
+    portfolio_risk = np.sqrt(
+        np.dot(current_allocation.T, np.dot(covariance_matrix, current_allocation))
+    )
+    return (
+        -(portfolio_return - risk_free_rate) / portfolio_risk
+    )  # Negative for minimization
+
+
+# Analytic gradient of the negative Sharpe ratio
+def sharpe_ratio_gradient(
+    current_allocation, expected_returns, covariance_matrix, risk_free_rate
+):
+    """
+    Gradient of sharpe_ratio with respect to the allocation:
+    -(mu / sigma) + (mu.w - rf) * (Cov w) / sigma^3
+
+    Returns:
+    numpy.ndarray: Gradient of the negative Sharpe ratio.
+    """
+    covariance_allocation = np.dot(covariance_matrix, current_allocation)
+    portfolio_risk = np.sqrt(np.dot(current_allocation, covariance_allocation))
+    excess_return = np.dot(current_allocation, expected_returns) - risk_free_rate
+    return (
+        -expected_returns / portfolio_risk
+        + excess_return * covariance_allocation / portfolio_risk**3
+    )
+
+
+# Normalize the current allocation into a feasible starting point
+def _warm_start(current_allocation):
+    current_allocation = np.clip(np.asarray(current_allocation, dtype=float), 0, None)
+    total = current_allocation.sum()
+    if total <= 0:
+        return np.full(len(current_allocation), 1 / len(current_allocation))
+    return current_allocation / total
+
+
+# Optimize one chunk of customers (runs in a worker process)
+def _optimize_chunk(
+    current_allocations, adjusted_returns, covariance_matrix, risk_free_rate
+):
+    constraints = {
+        "type": "eq",
+        "fun": lambda x: np.sum(x) - 1,
+        "jac": lambda x: np.ones_like(x),
+    }
+    bounds = tuple((0, 1) for _ in range(current_allocations.shape[1]))
+    optimized = np.empty_like(current_allocations, dtype=float)
+    for i in range(len(current_allocations)):
+        optimized[i] = minimize(
+            sharpe_ratio,
+            _warm_start(current_allocations[i]),
+            args=(adjusted_returns[i], covariance_matrix, risk_free_rate),
+            method="SLSQP",
+            jac=sharpe_ratio_gradient,
+            bounds=bounds,
+            constraints=constraints,
+        ).x
+    return np.clip(optimized, 0, 1)
+
+
+# Optimize the allocation of every customer in the book
+def optimize_allocations_batch(
+    current_allocations,
+    propensity_scores,
+    expected_returns,
+    covariance_matrix,
+    risk_free_rate,
+    workers=None,
+    chunk_size=2000,
+):
+    """
+    Batch version of optimize_allocation for the whole book.
+    Expected returns are adjusted for all customers at once, each customer is
+    warm-started from its current allocation and solved with the analytic Sharpe
+    gradient, and chunks of customers are spread across a process pool.
+
+    Parameters:
+    current_allocations (numpy.ndarray): (n_customers, n_assets) current allocations.
+    propensity_scores (numpy.ndarray): (n_customers, n_assets) propensity scores.
+    expected_returns (array-like): Expected returns for each asset.
+    covariance_matrix (numpy.ndarray): Covariance matrix of asset returns.
+    risk_free_rate (float): The risk-free rate of return.
+    workers (int, optional): Number of worker processes, default is os.cpu_count().
+    chunk_size (int, optional): Customers per task, default is 2000.
+
+    Returns:
+    tuple: (optimized allocations, adjusted expected returns), both (n_customers, n_assets).
+    """
+    current_allocations = np.asarray(current_allocations, dtype=float)
+    adjusted_returns = adjust_expected_returns_batch(
+        propensity_scores, expected_returns
+    )
+
+    starts = range(0, len(current_allocations), chunk_size)
+    chunks = [
+        (current_allocations[i : i + chunk_size], adjusted_returns[i : i + chunk_size])
+        for i in starts
+    ]
+    if workers == 1 or len(chunks) <= 1:
+        results = [
+            _optimize_chunk(a, r, covariance_matrix, risk_free_rate) for a, r in chunks
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    _optimize_chunk,
+                    [a for a, _ in chunks],
+                    [r for _, r in chunks],
+                    [covariance_matrix] * len(chunks),
+                    [risk_free_rate] * len(chunks),
+                )
+            )
+    optimized = (
+        np.concatenate(results) if results else np.empty((0, len(expected_returns)))
+    )
+    return optimized, adjusted_returns
+
+
+# Vectorized adjust_expected_returns for a (n_customers, n_assets) array of scores
+def adjust_expected_returns_batch(propensity_scores, expected_returns, alpha=0.1):
+    propensity_scores = np.asarray(propensity_scores, dtype=float)
+    return (1 + alpha * propensity_scores) * np.asarray(expected_returns, dtype=float)
+
+
+# Precomputed max-Sharpe weights over the propensity-adjusted return space
+class FrontierTable:
+    """
+    Lookup grid of max-Sharpe weights for the three-asset universe.
+    Propensity scores only rescale the expected returns (adjust_expected_returns),
+    so the optimal weights are a function of the scores alone. The table
+    solves SLSQP once per grid node and answers any customer by linear
+    interpolation in constant time, without calling scipy.optimize.minimize.
+    Scores with a value in fixed_scores get no grid axis: by default Deposito
+    is fixed at 0, as book_inputs sets it, so the grid covers SB and RD only
+    (16^2 nodes instead of 16^3) and the Deposito score of a customer is ignored.
+    Scores outside score_range are clipped to the grid; with the default grid
+    (0 to 3 in steps of 0.2) integer scores fall exactly on grid nodes.
+    """
+
+    def __init__(
+        self,
+        expected_returns,
+        covariance_matrix,
+        risk_free_rate,
+        score_range=(0.0, 3.0),
+        points=16,
+        alpha=0.1,
+        fixed_scores=(0.0, None, None),
+    ):
+        self.expected_returns = np.asarray(expected_returns, dtype=float)
+        self.covariance_matrix = covariance_matrix
+        self.risk_free_rate = risk_free_rate
+        self.alpha = alpha
+        self.score_range = score_range
+        self.fixed_scores = list(fixed_scores)
+        self.free = [i for i, score in enumerate(self.fixed_scores) if score is None]
+        axis = np.linspace(score_range[0], score_range[1], points)
+        self.axes = (axis,) * len(self.free)
+
+        free_nodes = np.stack(np.meshgrid(*self.axes, indexing="ij"), axis=-1).reshape(
+            -1, len(self.axes)
+        )
+        nodes = self._with_fixed_scores(
+            np.zeros((len(free_nodes), len(self.expected_returns)))
+        )
+        nodes[:, self.free] = free_nodes
+        adjusted_returns = adjust_expected_returns_batch(
+            nodes, self.expected_returns, alpha
+        )
+        start_allocations = np.full(nodes.shape, 1 / nodes.shape[1])
+        weights = _optimize_chunk(
+            start_allocations, adjusted_returns, covariance_matrix, risk_free_rate
+        )
+        self.grid = weights.reshape((points,) * len(self.axes) + (nodes.shape[1],))
+        self._interpolator = RegularGridInterpolator(self.axes, self.grid)
+
+    # Scores with the fixed axes set to their fixed values
+    def _with_fixed_scores(self, propensity_scores):
+        propensity_scores = np.array(propensity_scores, dtype=float)
+        for i, score in enumerate(self.fixed_scores):
+            if score is not None:
+                propensity_scores[:, i] = score
+        return propensity_scores
+
+    def weights(self, propensity_scores):
+        """
+        Max-Sharpe weights for one (n_assets,) or many (n_customers, n_assets) customers.
+        Scores on fixed axes are ignored.
+
+        Returns:
+        numpy.ndarray: Interpolated weights, renormalized to sum to 1.
+        """
+        propensity_scores = np.asarray(propensity_scores, dtype=float)
+        points = np.clip(
+            np.atleast_2d(propensity_scores)[:, self.free], *self.score_range
+        )
+        weights = np.clip(self._interpolator(points), 0, 1)
+        weights /= weights.sum(axis=1, keepdims=True)
+        return weights[0] if propensity_scores.ndim == 1 else weights
+
+    def validate(self, propensity_scores):
+        """
+        Compare table weights with the exact SLSQP solution for a sample of customers,
+        both on the scores with the fixed axes at their fixed values.
+
+        Returns:
+        dict: Max / mean absolute weight error and max / mean Sharpe ratio shortfall.
+        """
+        propensity_scores = self._with_fixed_scores(np.atleast_2d(propensity_scores))
+        adjusted_returns = adjust_expected_returns_batch(
+            propensity_scores, self.expected_returns, self.alpha
+        )
+        start_allocations = np.full(
+            propensity_scores.shape, 1 / propensity_scores.shape[1]
+        )
+        exact = _optimize_chunk(
+            start_allocations,
+            adjusted_returns,
+            self.covariance_matrix,
+            self.risk_free_rate,
+        )
+        table = self.weights(propensity_scores)
+
+        weight_error = np.abs(table - exact).max(axis=1)
+        sharpe_shortfall = np.array(
+            [
+                sharpe_ratio(
+                    table[i],
+                    adjusted_returns[i],
+                    self.covariance_matrix,
+                    self.risk_free_rate,
+                )
+                - sharpe_ratio(
+                    exact[i],
+                    adjusted_returns[i],
+                    self.covariance_matrix,
+                    self.risk_free_rate,
+                )
+                for i in range(len(exact))
+            ]
+        )
+        return {
+            "customers": len(exact),
+            "max_weight_error": weight_error.max(),
+            "mean_weight_error": weight_error.mean(),
+            "max_sharpe_shortfall": sharpe_shortfall.max(),
+            "mean_sharpe_shortfall": sharpe_shortfall.mean(),
+        }
+
+
+# Build optimizer inputs from the RM master data
+def book_inputs(customer_data):
+    """
+    Current allocations of the reallocated sleeve (Deposito = TD, SB = bonds,
+    RD = mutual funds), of the held CASA and BAC, and propensity scores (no
+    score for Deposito) for every customer.
+
+    Returns:
+    tuple: (customer IDs, sleeve allocations in USD, held allocations in USD, propensity scores).
+    """
+    current_usd = (
+        customer_data[
+            [
+                "usd_cur_td_allocation",
+                "usd_cur_bonds_allocation",
+                "usd_cur_mf_allocation",
+            ]
+        ]
+        .fillna(0)
+        .to_numpy(dtype=float)
+    )
+    held_usd = customer_data[list(held_assets.values())].fillna(0).to_numpy(dtype=float)
+    propensity_scores = np.column_stack(
+        [
+            np.zeros(len(customer_data)),
+            customer_data["Score SB"].fillna(0).to_numpy(dtype=float),
+            customer_data["Score RD"].fillna(0).to_numpy(dtype=float),
+        ]
+    )
+    customer_ids = customer_data["BP Number WM Core"].astype(int).to_numpy()
+    return customer_ids, current_usd, held_usd, propensity_scores
+
+
+# Lay out optimizer results in the optimized_allocation_usd.csv format (one row per customer and asset)
+def optimized_allocation_frame(
+    customer_ids, current_usd, optimized, expected_returns, fum_usd=None
+):
+    """
+    Rows for the reallocated sleeve. The optimized sleeve weights are scaled
+    to the sleeve's USD total, and allocations are expressed as shares of
+    fum_usd (each customer's total FUM, default: the sleeve total), the
+    denominator the CASA and BAC rows of the file use.
+    """
+    sleeve_usd = current_usd.sum(axis=1, keepdims=True)
+    fum_usd = sleeve_usd if fum_usd is None else np.reshape(fum_usd, (-1, 1))
+    current = np.divide(
+        current_usd, fum_usd, out=np.zeros_like(current_usd), where=fum_usd > 0
+    )
+    recommended_usd = optimized * sleeve_usd
+    recommended = np.divide(
+        recommended_usd,
+        fum_usd,
+        out=np.zeros_like(recommended_usd),
+        where=fum_usd > 0,
+    )
+    n_assets = len(assets)
+    return pd.DataFrame(
+        {
+            "BP Number WM Core": np.repeat(customer_ids, n_assets),
+            "asset_type": np.tile(assets, len(customer_ids)),
+            "cur_allocation": current.ravel(),
+            "recommended_allocation": recommended.ravel(),
+            "usd_current_allocation": current_usd.ravel(),
+            "current_expected_return": (current * expected_returns).ravel(),
+            "expected_return": (recommended * expected_returns).ravel(),
+            "usd_current_expected_return": (current_usd * expected_returns).ravel(),
+            "usd_expected_return": (recommended_usd * expected_returns).ravel(),
+            "usd_fee": (recommended_usd * fee_rates).ravel(),
+        }
+    )
+
+
+# CASA and BAC rows for customers the previous file has none for: held as they are
+def held_allocation_frame(customer_ids, held_usd, fum_usd, held_rates):
+    fum_usd = np.reshape(fum_usd, (-1, 1))
+    current = np.divide(
+        held_usd, fum_usd, out=np.zeros_like(held_usd), where=fum_usd > 0
+    )
+    returns = np.array([held_rates[asset][0] for asset in held_assets])
+    fees = np.array([held_rates[asset][1] for asset in held_assets])
+    n_assets = len(held_assets)
+    return pd.DataFrame(
+        {
+            "BP Number WM Core": np.repeat(customer_ids, n_assets),
+            "asset_type": np.tile(list(held_assets), len(customer_ids)),
+            "cur_allocation": current.ravel(),
+            "recommended_allocation": current.ravel(),
+            "usd_current_allocation": held_usd.ravel(),
+            "current_expected_return": (current * returns).ravel(),
+            "expected_return": (current * returns).ravel(),
+            "usd_current_expected_return": (held_usd * returns).ravel(),
+            "usd_expected_return": (held_usd * returns).ravel(),
+            "usd_fee": (held_usd * fees).ravel(),
+        }
+    )
+
+
+# Regenerate data/optimized_allocation_usd.csv for the whole book
+def main():
+    parser = argparse.ArgumentParser(
+        description="Regenerate optimized_allocation_usd.csv for the whole book."
+    )
+    parser.add_argument(
+        "--customer-data",
+        default=os.path.join(data_dir, "Master_Data_for_RM_Tableau_usd.csv"),
+    )
+    parser.add_argument(
+        "--output", default=os.path.join(data_dir, "optimized_allocation_usd.csv")
+    )
+    parser.add_argument(
+        "--config",
+        help="JSON with expected_returns (per asset), risk_free_rate, covariance_matrix and "
+        "held_assets (default: data/optimizer_config.json, else optimizer_config.sample.json)",
+    )
+    parser.add_argument(
+        "--expected-returns",
+        type=lambda v: [float(r) for r in v.split(",")],
+        metavar="DEPOSITO,SB,RD",
+        help="annual expected returns, overriding the config",
+    )
+    parser.add_argument("--risk-free-rate", type=float, help="overrides the config")
+    parser.add_argument(
+        "--covariance",
+        help=".npy covariance matrix of annual returns, overriding the config",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument(
+        "--method",
+        choices=["slsqp", "frontier"],
+        default="slsqp",
+        help="solve every customer with SLSQP, or interpolate a precomputed FrontierTable",
+    )
+    parser.add_argument(
+        "--validate-frontier",
+        type=int,
+        metavar="N",
+        help="only report FrontierTable error against SLSQP for N customers of the book",
+    )
+    args = parser.parse_args()
+
+    if args.config is None:
+        args.config = os.path.join(data_dir, "optimizer_config.json")
+        if not os.path.exists(args.config):
+            print(
+                f"{args.config} not found, using the sample assumptions in {sample_config}",
+                file=sys.stderr,
+            )
+            args.config = sample_config
+    try:
+        market = load_market_inputs(
+            args.config if os.path.exists(args.config) else None,
+            args.covariance,
+            args.expected_returns,
+            args.risk_free_rate,
+        )
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    expected_returns = market[0]
+
+    customer_ids, current_usd, held_usd, propensity_scores = book_inputs(
+        pd.read_csv(args.customer_data)
+    )
+
+    if args.validate_frontier:
+        start = time.perf_counter()
+        frontier = FrontierTable(*market)
+        print(f"Frontier table built in {time.perf_counter() - start:.2f} s")
+        sample = np.random.default_rng(0).choice(
+            len(propensity_scores),
+            min(args.validate_frontier, len(propensity_scores)),
+            replace=False,
+        )
+        for key, value in frontier.validate(propensity_scores[sample]).items():
+            print(f"{key}: {value:.6g}")
+        return
+
+    start = time.perf_counter()
+    if args.method == "frontier":
+        optimized = FrontierTable(*market).weights(propensity_scores)
+    else:
+        optimized, _ = optimize_allocations_batch(
+            current_usd,
+            propensity_scores,
+            *market,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+        )
+    elapsed = time.perf_counter() - start
+
+    # Only the TD + bonds + mutual funds sleeve is reallocated; every allocation
+    # is a share of the customer's total FUM, as in the app's file
+    fum_usd = current_usd.sum(axis=1) + held_usd.sum(axis=1)
+    frame = optimized_allocation_frame(
+        customer_ids, current_usd, optimized, expected_returns, fum_usd
+    )
+
+    # CASA and BAC rows are carried through unchanged from the previous file;
+    # customers it has no rows for get them from the master data
+    previous = pd.read_csv(args.output) if os.path.exists(args.output) else None
+    parts = [frame]
+    carried = np.zeros(len(customer_ids), dtype=bool)
+    if previous is not None:
+        held = previous[
+            previous["asset_type"].isin(list(held_assets))
+            & previous["BP Number WM Core"].isin(customer_ids)
+        ]
+        parts.append(held.drop(columns=[c for c in held.columns if c not in frame]))
+        carried = np.isin(customer_ids, held["BP Number WM Core"].unique())
+    if not carried.all():
+        held_rates = (
+            load_held_asset_rates(args.config) if os.path.exists(args.config) else {}
+        )
+        unknown = [asset for asset in held_assets if asset not in held_rates]
+        if unknown:
+            parser.error(
+                f"{(~carried).sum():,} customers have no {', '.join(held_assets)} rows in "
+                f"{args.output}; set held_assets rates for {', '.join(unknown)} in {args.config}"
+            )
+        parts.append(
+            held_allocation_frame(
+                customer_ids[~carried],
+                held_usd[~carried],
+                fum_usd[~carried],
+                held_rates,
+            )
+        )
+    frame = pd.concat(parts, ignore_index=True)
+
+    # Keep the product picks, which the optimizer doesn't own, from the previous file
+    columns = list(frame.columns)
+    if previous is not None:
+        product_columns = [c for c in previous.columns if c.startswith("product_")]
+        if product_columns:
+            frame = frame.merge(
+                previous[["BP Number WM Core", "asset_type"] + product_columns],
+                on=["BP Number WM Core", "asset_type"],
+                how="left",
+            )
+        # Same column order as the file being replaced
+        columns = [c for c in previous.columns if c in frame.columns]
+        columns += [c for c in frame.columns if c not in columns]
+
+    order = {asset: i for i, asset in enumerate(asset_type_order)}
+    frame = frame.assign(_order=frame["asset_type"].map(order)).sort_values(
+        ["BP Number WM Core", "_order"], kind="stable"
+    )
+    frame[columns].to_csv(args.output, index=False)
+
+    print(
+        f"Optimized {len(customer_ids):,} customers in {elapsed:.2f} s "
+        f"({len(customer_ids) / max(elapsed, 1e-9):,.0f} customers/s), wrote {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import asyncio
+import re
+from collections import Counter, defaultdict
+
+import pandas as pd
+from data import bump_data_version
+from db import fetch_dataframe
+
+
+# Normalize a product name for matching: uppercase, punctuation to spaces, single spaces
+def normalize_product_name(name: str) -> str:
+    return " ".join(re.sub(r"[^0-9A-Z]+", " ", str(name).upper()).split())
+
+
+# Character trigrams of a normalized name, padded per word like pg_trgm
+def name_trigrams(normalized_name: str) -> set:
+    trigrams = set()
+    for word in normalized_name.split():
+        padded = f"  {word} "
+        trigrams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+# In-memory product catalog with a trigram inverted index
+class ProductResolver:
+    """
+    Resolves product names (from optimized_portfolio or user text) to rows of the
+    product catalog without touching the database. Names are normalized once and
+    indexed by character trigram, so lookups only score products that share at
+    least one trigram with the query and tolerate typos and partial names.
+    """
+
+    def __init__(self):
+        self.products = pd.DataFrame()
+        self._names = []
+        self._trigram_counts = []
+        self._postings = {}
+
+    @property
+    def is_loaded(self) -> bool:
+        return not self.products.empty
+
+    # (Re)build the index from a product catalog frame
+    def load(self, products: pd.DataFrame, name_column: str = "Product Name"):
+        products = products.reset_index(drop=True)
+        names = [normalize_product_name(name) for name in products[name_column]]
+        postings = defaultdict(list)
+        trigram_counts = []
+        for position, name in enumerate(names):
+            trigrams = name_trigrams(name)
+            trigram_counts.append(len(trigrams))
+            for trigram in trigrams:
+                postings[trigram].append(position)
+
+        self._names = names
+        self._trigram_counts = trigram_counts
+        self._postings = {trigram: tuple(p) for trigram, p in postings.items()}
+        self.products = products
+
+    # Count shared trigrams between the query and every candidate product
+    def _shared_trigrams(self, trigrams: set) -> Counter:
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(self._postings.get(trigram, ()))
+        return shared
+
+    def resolve(self, name: str, limit: int = 1, threshold: float = 0.3) -> list:
+        """
+        Rank catalog products for a product name.
+        Products whose normalized name contains the query (the old LIKE '%name%'
+        match) rank first, then by trigram similarity (Jaccard, as pg_trgm).
+
+        Returns:
+        list: (position in self.products, similarity) pairs, best first.
+        """
+        query = normalize_product_name(name)
+        trigrams = name_trigrams(query)
+        if not trigrams:
+            return []
+
+        ranked = []
+        for position, shared in self._shared_trigrams(trigrams).items():
+            similarity = shared / (
+                len(trigrams) + self._trigram_counts[position] - shared
+            )
+            contains = query in self._names[position]
+            if contains or similarity >= threshold:
+                ranked.append((contains, similarity, position))
+        ranked.sort(reverse=True)
+        return [(position, similarity) for _, similarity, position in ranked[:limit]]
+
+    def mentions(self, text: str, limit: int = 5, threshold: float = 0.7) -> list:
+        """
+        Find catalog products mentioned in free text, scored by the share of the
+        product name's trigrams that appear in the text.
+
+        Returns:
+        list: Canonical product names, best first.
+        """
+        trigrams = name_trigrams(normalize_product_name(text))
+        ranked = []
+        for position, shared in self._shared_trigrams(trigrams).items():
+            coverage = shared / self._trigram_counts[position]
+            if coverage >= threshold:
+                ranked.append((coverage, position))
+        ranked.sort(reverse=True)
+        names = dict.fromkeys(
+            self.products["Product Name"].iat[position] for _, position in ranked
+        )
+        return list(names)[:limit]
+
+
+# Process-wide product resolver, loaded from product_data on startup
+product_resolver = ProductResolver()
+# Created on first use so it binds to the server's event loop
+_product_resolver_lock = None
+
+
+# Load the product catalog into the resolver if it isn't loaded yet
+async def ensure_product_resolver(reload: bool = False) -> ProductResolver:
+    global _product_resolver_lock
+    if product_resolver.is_loaded and not reload:
+        return product_resolver
+    if _product_resolver_lock is None:
+        _product_resolver_lock = asyncio.Lock()
+    async with _product_resolver_lock:
+        if reload or not product_resolver.is_loaded:
+            product_resolver.load(await fetch_dataframe("SELECT * FROM product_data"))
+            bump_data_version()
+    return product_resolver
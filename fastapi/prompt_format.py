@@ -0,0 +1,67 @@
+import math
+import numbers
+
+import pandas as pd
+from setup import PROMPT_TABLE_FORMAT
+
+# Encoding of tables embedded in prompts: "table" (header-once pipe table) or
+# "records" (the list of dicts of DataFrame.to_dict(orient="records"))
+table_format = PROMPT_TABLE_FORMAT
+
+# Columns holding identifiers or periods, printed as is instead of compacted
+identifier_columns = {"BP Number WM Core", "Customer ID", "Transaction ID", "Year"}
+
+_scales = [(1e9, "B"), (1e6, "M"), (1e3, "K")]
+
+
+# Compact number for a prompt: K/M/B above a thousand, 4 significant digits below
+# (integers below a thousand as they are)
+def format_number(value, digits: int = 4) -> str:
+    if isinstance(value, numbers.Integral) and abs(value) < 1000:
+        return str(value)
+    # Decimal (psycopg's numeric, e.g. SUM or ROUND results) doesn't mix with floats
+    value = float(value)
+    if math.isnan(value):
+        return ""
+    for scale, suffix in _scales:
+        if abs(value) >= scale:
+            return f"{value / scale:.2f}{suffix}"
+    return f"{value:.{digits}g}"
+
+
+# One table cell: numbers compacted, missing values empty, no separators or newlines
+def _cell(value, exact: bool = False) -> str:
+    if value is None or value is pd.NA or value is pd.NaT:
+        return ""
+    if isinstance(value, (bool, str)) or not isinstance(value, numbers.Number):
+        return " ".join(str(value).replace("|", "/").split())
+    if not exact:
+        return format_number(value)
+    if isinstance(value, numbers.Integral):
+        return str(value)
+    if math.isnan(value):
+        return ""
+    # IDs read as float when a column has gaps (e.g. 1006299.0)
+    return f"{value:.0f}" if float(value).is_integer() else str(value)
+
+
+def prompt_table(frame: pd.DataFrame) -> str:
+    """
+    Encode a DataFrame for a prompt as a pipe-separated table with the header
+    written once, instead of repeating every column name on every row.
+    Numbers are rounded and written with K/M/B suffixes; identifier columns
+    (customer and transaction IDs, years) are written exactly.
+    """
+    if table_format == "records":
+        return str(frame.to_dict(orient="records"))
+    columns = [str(column) for column in frame.columns]
+    exact = [column in identifier_columns for column in columns]
+    lines = ["|".join(_cell(column) for column in columns)]
+    for row in frame.itertuples(index=False, name=None):
+        lines.append("|".join(_cell(v, e) for v, e in zip(row, exact)))
+    return "\n".join(lines)
+
+
+# Rough token count of a prompt (about four characters per token for English text)
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // 4)
@@ -2,7 +2,8 @@ import os
 from typing import Optional
 
 import dotenv
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from pydantic import BaseModel
 
 from fastapi import FastAPI
@@ -10,12 +11,86 @@ from fastapi import FastAPI
 # Load environment variables
 dotenv.load_dotenv()
 
-# Initialize OpenRouter client (OpenAI-compatible API)
-client = OpenAI(
+# OpenRouter HTTP connection pool configuration
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+
+# Initialize async OpenRouter client (OpenAI-compatible API).
+# One shared keep-alive pool per process, so concurrent chats reuse TLS connections
+# and the LLM round trips don't block the event loop.
+client = AsyncOpenAI(
     api_key=os.getenv("OPENROUTER_API_KEY"),
-    base_url="https://openrouter.ai/api/v1",
+    base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    ),
 )
 
+# Tool-selection cache configuration
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "1024"))
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "3600"))
+
+# Rendered prompt cache configuration
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "4096"))
+PROMPT_CACHE_MAX_BYTES = int(os.getenv("PROMPT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Generated SQL cache configuration
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "1024"))
+# Seconds between writes of the last use of served entries to the sql_cache table
+SQL_CACHE_USAGE_FLUSH_SECONDS = float(os.getenv("SQL_CACHE_USAGE_FLUSH_SECONDS", "60"))
+
+# Generated SQL result cache configuration
+SQL_RESULT_CACHE_SIZE = int(os.getenv("SQL_RESULT_CACHE_SIZE", "512"))
+SQL_RESULT_CACHE_TTL = float(os.getenv("SQL_RESULT_CACHE_TTL", "900"))
+SQL_RESULT_CACHE_MAX_BYTES = int(
+    os.getenv("SQL_RESULT_CACHE_MAX_BYTES", str(128 * 1024 * 1024))
+)
+
+# Encoding of tables in prompts: "table" (compact, header once) or "records"
+PROMPT_TABLE_FORMAT = os.getenv("PROMPT_TABLE_FORMAT", "table")
+
+# Prompt builders started speculatively for the customer while tool routing runs
+PREFETCH_FUNCTIONS = [
+    name.strip()
+    for name in os.getenv(
+        "PREFETCH_FUNCTIONS",
+        "present_customer_profile,present_optimized_portfolio,present_recommended_products",
+    ).split(",")
+    if name.strip()
+]
+# Worker threads speculative prompt builds may hold at once
+PREFETCH_MAX_THREADS = int(os.getenv("PREFETCH_MAX_THREADS", "4"))
+
+# Seconds a structured-output call runs before a JSON-mode request is sent
+# alongside it; 0 sends both at once, "off" only falls back after a failure
+STRUCTURED_HEDGE_DELAY = os.getenv("STRUCTURED_HEDGE_DELAY", "2").strip().lower()
+STRUCTURED_HEDGE_DELAY = (
+    None if STRUCTURED_HEDGE_DELAY in ("", "off") else float(STRUCTURED_HEDGE_DELAY)
+)
+
+# Datasets to load at startup instead of on first access (comma-separated names)
+DATA_WARM_DATASETS = [
+    name.strip()
+    for name in os.getenv("DATA_WARM_DATASETS", "").split(",")
+    if name.strip()
+]
+
+# Seconds between checks of the ingestion_manifest table for a new ingestion,
+# which invalidates cached SQL results and prompts in every worker
+DATA_VERSION_CHECK_SECONDS = float(os.getenv("DATA_VERSION_CHECK_SECONDS", "5"))
+
+# Directory the loader process publishes datasets to for all workers
+# (e.g. /dev/shm/wealth-ai); unset to have each worker read the snapshot itself
+SHARED_DATA_DIR = os.getenv("SHARED_DATA_DIR")
+
 # FastAPI app
 app = FastAPI()
 
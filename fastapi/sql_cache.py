@@ -0,0 +1,148 @@
+import logging
+
+from cache import LRUCache, normalize_text
+from db import db_connection
+
+logger = logging.getLogger(__name__)
+
+create_sql_cache_table = """
+    CREATE TABLE IF NOT EXISTS sql_cache (
+        function_name TEXT NOT NULL,
+        schema_fingerprint TEXT NOT NULL,
+        question TEXT NOT NULL,
+        sql_syntax TEXT NOT NULL,
+        used_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (function_name, schema_fingerprint, question)
+    )
+"""
+
+
+# Cache of generated SQL by normalized question, persisted in PostgreSQL
+class SQLCache:
+    """
+    Maps (SQL function, table schema fingerprint, normalized question) to SQL that
+    already executed and returned rows, so a repeated question skips the LLM.
+    Lookups hit an in-process LRU first; entries are also written to the
+    sql_cache table, which a local miss reads through to (one primary-key
+    SELECT, cheap next to the LLM call it saves), so SQL stored by one worker is
+    served by all of them. Hits are only noted in memory; flush_usage writes
+    their used_at in one statement, off the request path. The most recently
+    used entries are reloaded on startup, so the cache survives restarts. A
+    schema change changes the fingerprint, so SQL written against an old
+    schema is never served.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = LRUCache(maxsize=maxsize)
+        self._table_ready = False
+        # Keys served since the last flush_usage
+        self._used = set()
+
+    @staticmethod
+    def key(function_name: str, schema_fingerprint: str, question: str) -> tuple:
+        return (function_name, schema_fingerprint, normalize_text(question))
+
+    # Cached SQL for key, from memory or else the sql_cache table; None if absent
+    async def get(self, key: tuple):
+        sql_syntax = self._entries.get(key)
+        if sql_syntax is None:
+            try:
+                async with db_connection() as conn:
+                    await self._ensure_table(conn)
+                    cursor = await conn.execute(
+                        "SELECT sql_syntax FROM sql_cache WHERE function_name = %s "
+                        "AND schema_fingerprint = %s AND question = %s",
+                        key,
+                    )
+                    row = await cursor.fetchone()
+            except Exception as e:
+                logger.warning(f"Could not read cached SQL: {e}")
+                return None
+            if row is None:
+                return None
+            sql_syntax = row[0]
+            self._entries.set(key, sql_syntax)
+        self._used.add(key)
+        return sql_syntax
+
+    # Record when the entries served since the last call were used, in one UPDATE
+    async def flush_usage(self):
+        if not self._used:
+            return
+        used, self._used = self._used, set()
+        try:
+            async with db_connection() as conn:
+                await self._ensure_table(conn)
+                await conn.execute(
+                    "UPDATE sql_cache SET used_at = now() "
+                    "FROM unnest(%s::text[], %s::text[], %s::text[]) "
+                    "AS used(function_name, schema_fingerprint, question) "
+                    "WHERE sql_cache.function_name = used.function_name "
+                    "AND sql_cache.schema_fingerprint = used.schema_fingerprint "
+                    "AND sql_cache.question = used.question",
+                    [list(column) for column in zip(*used)],
+                )
+        except Exception as e:
+            logger.warning(f"Could not record cached SQL usage: {e}")
+
+    async def _ensure_table(self, conn):
+        if not self._table_ready:
+            await conn.execute(create_sql_cache_table)
+            self._table_ready = True
+
+    # Load the most recently stored entries and drop the rest from the table
+    async def load(self):
+        async with db_connection() as conn:
+            await self._ensure_table(conn)
+            cursor = await conn.execute(
+                "SELECT function_name, schema_fingerprint, question, sql_syntax "
+                "FROM sql_cache ORDER BY used_at DESC LIMIT %s",
+                (self.maxsize,),
+            )
+            rows = await cursor.fetchall()
+            await conn.execute(
+                "DELETE FROM sql_cache WHERE used_at < "
+                "(SELECT min(used_at) FROM (SELECT used_at FROM sql_cache "
+                "ORDER BY used_at DESC LIMIT %s) AS kept)",
+                (self.maxsize,),
+            )
+        # Oldest first, so the LRU order matches the table's
+        for function_name, schema_fingerprint, question, sql_syntax in reversed(rows):
+            self._entries.set((function_name, schema_fingerprint, question), sql_syntax)
+        logger.info(f"Loaded {len(rows)} cached SQL queries")
+
+    # Remember SQL that executed and returned rows; persistence is best effort
+    async def store(self, key: tuple, sql_syntax: str):
+        self._entries.set(key, sql_syntax)
+        try:
+            async with db_connection() as conn:
+                await self._ensure_table(conn)
+                await conn.execute(
+                    "INSERT INTO sql_cache "
+                    "(function_name, schema_fingerprint, question, sql_syntax) "
+                    "VALUES (%s, %s, %s, %s) "
+                    "ON CONFLICT (function_name, schema_fingerprint, question) "
+                    "DO UPDATE SET sql_syntax = EXCLUDED.sql_syntax, used_at = now()",
+                    (*key, sql_syntax),
+                )
+        except Exception as e:
+            logger.warning(f"Could not persist cached SQL: {e}")
+
+    # Forget SQL that no longer executes (e.g. the data changed shape)
+    async def discard(self, key: tuple):
+        self._entries.discard(key)
+        self._used.discard(key)
+        try:
+            async with db_connection() as conn:
+                await self._ensure_table(conn)
+                await conn.execute(
+                    "DELETE FROM sql_cache WHERE function_name = %s "
+                    "AND schema_fingerprint = %s AND question = %s",
+                    key,
+                )
+        except Exception as e:
+            logger.warning(f"Could not remove cached SQL: {e}")
+
+    def stats(self) -> dict:
+        return self._entries.stats()
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Strategies for getting a typed result out of the LLM, in the order they start
+STRATEGIES = ("structured", "json")
+
+
+# Raised when no strategy produced a valid result
+class StructuredOutputError(Exception):
+    pass
+
+
+# Which strategy answered structured-output requests, per call path
+class HedgeStats:
+    """
+    Per-path counts of calls, fired hedges, wins and failures by strategy, and
+    the latency of recent winning calls. The structured-output latency
+    percentiles are what STRUCTURED_HEDGE_DELAY is tuned against: a delay
+    near their p95 only hedges the slow tail, while frequent JSON-mode wins
+    mean structured output is slow or failing on that path.
+    """
+
+    def __init__(self, window: int = 256):
+        self.window = window
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        path: str,
+        winner: Optional[str],
+        seconds: float,
+        hedged: bool,
+        failed: list,
+    ):
+        with self._lock:
+            entry = self._paths.get(path)
+            if entry is None:
+                entry = self._paths[path] = {
+                    "calls": 0,
+                    "hedged": 0,
+                    "wins": Counter(),
+                    "failures": Counter(),
+                    "seconds": {s: deque(maxlen=self.window) for s in STRATEGIES},
+                }
+            entry["calls"] += 1
+            entry["hedged"] += hedged
+            entry["failures"].update(failed)
+            if winner is not None:
+                entry["wins"][winner] += 1
+                entry["seconds"][winner].append(seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                path: {
+                    "calls": entry["calls"],
+                    "hedged": entry["hedged"],
+                    "wins": {s: entry["wins"][s] for s in STRATEGIES},
+                    "failures": {s: entry["failures"][s] for s in STRATEGIES},
+                    "latency": {
+                        s: _percentiles(seconds)
+                        for s, seconds in entry["seconds"].items()
+                        if seconds
+                    },
+                }
+                for path, entry in self._paths.items()
+            }
+
+
+def _percentiles(seconds) -> dict:
+    ordered = sorted(seconds)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+    return {"p50": pick(0.5), "p95": pick(0.95), "samples": len(ordered)}
+
+
+# Process-wide statistics, reported by /health
+hedge_stats = HedgeStats()
+
+
+async def hedged_call(
+    path: str,
+    structured: Callable[[], Awaitable],
+    json_mode: Callable[[], Awaitable],
+    delay: Optional[float],
+    stats: HedgeStats = hedge_stats,
+):
+    """
+    Get a typed result from the structured-output call, hedged with a JSON-mode
+    call. The JSON-mode call starts when the structured call fails, or once
+    `delay` seconds pass without an answer; the first valid result wins and the
+    other call is cancelled.
+
+    Parameters:
+    path (str): Name the statistics are kept under (e.g. the function name)
+    structured (Callable): Starts the structured-output request; returns the result or raises
+    json_mode (Callable): Starts the JSON-mode request; returns the result or raises
+    delay (float): Seconds before the hedge fires; 0 sends both at once, None only on failure
+
+    Returns:
+    tuple: (result, name of the winning strategy)
+    """
+    start = time.perf_counter()
+    tasks = {asyncio.ensure_future(structured()): "structured"}
+    hedged = False
+    errors = {}
+    try:
+        while tasks:
+            timeout = None
+            if not hedged and delay is not None:
+                timeout = max(0.0, start + delay - time.perf_counter())
+            done, _ = await asyncio.wait(
+                tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                strategy = tasks.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    logger.warning(f"{path}: {strategy} output failed: {e}")
+                    errors[strategy] = e
+                    continue
+                seconds = time.perf_counter() - start
+                stats.record(path, strategy, seconds, hedged, list(errors))
+                logger.info(f"{path}: {strategy} output won in {seconds:.2f} s")
+                return result, strategy
+            # Hedge when the delay ran out or structured output already failed
+            if not hedged and (not done or not tasks):
+                hedged = True
+                logger.info(f"{path}: starting JSON mode request")
+                tasks[asyncio.ensure_future(json_mode())] = "json"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    stats.record(path, None, time.perf_counter() - start, hedged, list(errors))
+    raise StructuredOutputError(
+        f"{path}: no valid output ("
+        + "; ".join(f"{strategy}: {e}" for strategy, e in errors.items())
+        + ")"
+    )
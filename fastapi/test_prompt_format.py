@@ -0,0 +1,47 @@
+import os
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+# setup.py builds the OpenRouter client on import
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+from prompt_format import format_number, prompt_table
+
+
+def test_format_number_decimal():
+    assert format_number(Decimal("12345.50")) == "12.35K"
+    assert format_number(Decimal("2500000")) == "2.50M"
+    assert format_number(Decimal("0.123456")) == "0.1235"
+    assert format_number(Decimal("NaN")) == ""
+
+
+def test_format_number_float_and_int():
+    assert format_number(float("nan")) == ""
+    assert format_number(np.float64(1234.5)) == "1.23K"
+    assert format_number(-1.5e9) == "-1.50B"
+    assert format_number(1234567) == "1.23M"
+    assert format_number(np.int64(2_500_000_000)) == "2.50B"
+    assert format_number(-4200) == "-4.20K"
+    assert format_number(np.int64(42)) == "42"
+
+
+def test_prompt_table_sql_result_types():
+    frame = pd.DataFrame(
+        {
+            "Customer ID": [Decimal("1006299"), Decimal("1006300")],
+            "total": [Decimal("12345.50"), None],
+            "count": [3, 4],
+            "aum": np.array([1500000, 250], dtype=np.int64),
+            "avg": [float("nan"), 0.5],
+        }
+    )
+    assert prompt_table(frame) == (
+        "Customer ID|total|count|aum|avg\n1006299|12.35K|3|1.50M|\n1006300||4|250|0.5"
+    )
+
+
+def test_prompt_table_integer_identifiers_exact():
+    frame = pd.DataFrame({"BP Number WM Core": [1006299], "Year": [2023]})
+    assert prompt_table(frame) == "BP Number WM Core|Year\n1006299|2023"